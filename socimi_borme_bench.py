@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks del SOCIMI BORME Watcher sobre un corpus sintético de actos BORME (Sección C).
+Uso: python socimi_borme_bench.py {regex,extract} [--acts N] [--seed S]
+     python socimi_borme_bench.py pipeline [--days N] [--acts N] [--latency MS] [--error-rate P] [--replay DIR]
+"""
+from __future__ import annotations
+import sys, os, io, json, time, random, asyncio, sqlite3, argparse, tempfile, threading, contextlib, multiprocessing
+import datetime as dt
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, urlsplit
+
+import socimi_borme_pipeline as pipeline
+
+FRASES = [
+    "Constitución. Comienzo de operaciones: {fecha}.",
+    "Objeto social: La compraventa, arrendamiento y promoción de toda clase de bienes inmuebles.",
+    "Domicilio: C/ {calle} {num} ({ciudad}).",
+    "Capital: {capital},00 Euros.",
+    "Nombramientos. Adm. Unico: {persona}.",
+    "Ceses/Dimisiones. Consejero: {persona}.",
+    "Ampliación de capital. Capital: {capital},00 Euros. Resultante Suscrito: {capital},00 Euros.",
+    "Modificaciones estatutarias. Artículo {num} de los estatutos sociales.",
+    "Revocaciones. Apoderado: {persona}.",
+    "Datos registrales. T {num} , F {num}, S 8, H M {num}, I/A 3 ({fecha}).",
+]
+# Frases que mencionan SOCIMI (algunas casan con ADOPTION_PATTERNS y otras no)
+FRASES_SOCIMI = [
+    "La Junta General acuerda acogerse al régimen fiscal especial de las SOCIMI regulado en la Ley 11/2009.",
+    "Se opta por la aplicación del régimen fiscal especial previsto para las SOCIMI.",
+    "Adaptación de estatutos a la Ley 11/2009, de 26 de octubre, para su acogimiento al régimen especial.",
+    "Otros conceptos: SOCIMI cotizada en BME Growth.",
+    "Renuncia al régimen de la Ley 11/2009 por acuerdo de la junta.",
+]
+CALLES = ["Mayor", "Alcalá", "Serrano", "Gran Vía", "Diagonal", "Colón"]
+CIUDADES = ["MADRID", "BARCELONA", "VALENCIA", "SEVILLA", "MÁLAGA", "BILBAO"]
+PERSONAS = ["GARCIA LOPEZ JUAN", "MARTINEZ RUIZ ANA", "FERNANDEZ SANZ LUIS", "INVERSIONES DEL SUR SL"]
+
+def synthetic_acts(n: int, seed: int = 2009, socimi_ratio: float = 0.02) -> List[str]:
+    rnd = random.Random(seed)
+    acts = []
+    for i in range(n):
+        parts = [f"{i + 1} - EMPRESA {rnd.randint(1, 99999)} SOCIEDAD LIMITADA."]
+        for _ in range(rnd.randint(3, 9)):
+            parts.append(rnd.choice(FRASES).format(
+                fecha=f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.24",
+                calle=rnd.choice(CALLES), num=rnd.randint(1, 9999), ciudad=rnd.choice(CIUDADES),
+                capital=f"{rnd.randint(3, 900)}.000", persona=rnd.choice(PERSONAS),
+            ))
+        if rnd.random() < socimi_ratio:
+            parts.insert(rnd.randint(1, len(parts)), rnd.choice(FRASES_SOCIMI))
+        acts.append(" ".join(parts))
+    return acts
+
+def find_adoption_reference(text: str) -> Optional[Tuple[str, str]]:
+    """
+    Implementación original: recorre los seis patrones secuencialmente sin prefiltro.
+    """
+    for rx in pipeline.ADOPTION_REGEXES:
+        m = rx.search(text)
+        if m:
+            start = max(m.start() - 140, 0)
+            end = min(m.end() + 140, len(text))
+            return rx.pattern, text[start:end]
+    return None
+
+def _throughput(fn, texts: List[str], mb: float) -> Tuple[float, list]:
+    t0 = time.perf_counter()
+    out = [fn(t) for t in texts]
+    secs = time.perf_counter() - t0
+    return mb / secs, out
+
+def cmd_regex(args):
+    texts = synthetic_acts(args.acts, args.seed)
+    mb = sum(len(t.encode("utf-8")) for t in texts) / 1e6
+    ref_rate, ref = _throughput(find_adoption_reference, texts, mb)
+    new_rate, new = _throughput(pipeline.find_adoption, texts, mb)
+    if ref != new:
+        print("ERROR: find_adoption no coincide con la implementación de referencia", file=sys.stderr)
+        sys.exit(1)
+    hits = sum(1 for h in new if h)
+    print(f"Corpus: {len(texts)} actos, {mb:.1f} MB, {hits} coincidencias")
+    print(f"  referencia (secuencial): {ref_rate:8.1f} MB/s")
+    print(f"  find_adoption:           {new_rate:8.1f} MB/s  (x{new_rate / ref_rate:.1f})")
+
+def synthetic_pages(acts: List[str]) -> List[str]:
+    """
+    Envuelve cada acto en una página similar a las de boe.es (cabecera, navegación, scripts, pie).
+    """
+    pages = []
+    for i, act in enumerate(acts):
+        body = act.replace("&", "&amp;").replace(". ", ".</p>\n<p>")
+        pages.append(
+            "<!DOCTYPE html><html lang=\"es\"><head><meta charset=\"utf-8\">"
+            f"<title>BOE.es - BORME-C-2024-{i}</title><style>p {{ margin: 0 }}</style>"
+            "<script>var _paq = window._paq || [];</script></head><body>"
+            "<header><a href=\"/\">Agencia Estatal Bolet&iacute;n Oficial del Estado</a></header>"
+            "<nav><ul><li>Diario BORME</li><li>Buscar</li></ul></nav>"
+            f"<div id=\"DOdocText\"><h3>BORME-C-2024-{i}</h3><!-- texto del anuncio --><p>{body}</p></div>"
+            "<footer>&copy; Agencia Estatal Bolet&iacute;n Oficial del Estado</footer></body></html>"
+        )
+    return pages
+
+def cmd_extract(args):
+    pages = synthetic_pages(synthetic_acts(args.acts, args.seed, socimi_ratio=0.05))
+    names = ["html5lib", "htmlparser"] + (["lxml"] if pipeline.lxml_etree is not None else [])
+    results = {}
+    for name in names:
+        fn = pipeline.TEXT_EXTRACTORS[name]
+        t0 = time.perf_counter()
+        texts = [fn(p) for p in pages]
+        secs = time.perf_counter() - t0
+        results[name] = texts
+        print(f"  {name:<10} {len(pages) / secs:9.0f} docs/s")
+    ref = [pipeline.find_adoption(t) for t in results["html5lib"]]
+    for name in names[1:]:
+        same_text = sum(1 for a, b in zip(results["html5lib"], results[name]) if a == b)
+        hits = [pipeline.find_adoption(t) if t is not None else None for t in results[name]]
+        print(f"  paridad {name}: texto idéntico {same_text}/{len(pages)}, find_adoption idéntico: {hits == ref}")
+        if hits != ref:
+            sys.exit(1)
+
+class BoeStandIn:
+    """
+    Servidor HTTP local que imita boe.es: el sumario en su ruta real (JSON con la Sección C) y
+    /act/<id> (HTML), de modo que el pipeline llega a él con --source http://127.0.0.1:<puerto>.
+    Genera los actos sintéticamente o reproduce una caché grabada (DiskCache de run/backfill), con
+    latencia (+/- jitter) y una proporción de respuestas 503 (Retry-After: 0) configurables.
+    """
+    def __init__(self, acts_per_day: int = 60, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 2009, replay_dir: Optional[str] = None):
+        self.acts_per_day = acts_per_day
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.seed = seed
+        self.replay = pipeline.DiskCache(replay_dir) if replay_dir else None
+        self.sumario_prefix = urlsplit(pipeline.SUMARIO_URL).path.partition("{date}")[0]
+        self.requests = 0
+        self.errors = 0
+        self._pages: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        self._rnd = random.Random(seed)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self) -> "BoeStandIn":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def replay_dates(self, start: dt.date, end: dt.date) -> List[dt.date]:
+        return [d for d in pipeline.daterange(start, end)
+                if self.replay.get(pipeline.SUMARIO_URL.format(date=pipeline.yyyymmdd(d))) is not None]
+
+    def _day_pages(self, day: str) -> List[str]:
+        with self._lock:
+            if day not in self._pages:
+                acts = synthetic_acts(self.acts_per_day, self.seed + int(day), socimi_ratio=0.05)
+                self._pages[day] = synthetic_pages(acts)
+            return self._pages[day]
+
+    def _sumario(self, day: str) -> Optional[bytes]:
+        if self.replay is not None:
+            hit = self.replay.get(pipeline.SUMARIO_URL.format(date=day))
+            if hit is None:
+                return None
+            sumario = json.loads(hit[0])
+            # Los actos se piden a este servidor, que los sirve desde la caché por su URL original
+            for item, _ in pipeline.iter_section_c_items(sumario):
+                url = pipeline._item_url(item, "url_html")
+                if url:
+                    item["url_html"] = {"texto": f"{self.base_url}/act?u={quote(url, safe='')}"}
+            return json.dumps(sumario).encode("utf-8")
+        items = [{"identificador": f"BORME-C-{day}-{i}", "titulo": f"EMPRESA {day}-{i} SL",
+                  "url_html": {"texto": f"{self.base_url}/act/{day}/{i}"}, "url_pdf": {"texto": ""}}
+                 for i in range(self.acts_per_day)]
+        sumario = {"data": {"sumario": {"diario": [{"seccion": [{"codigo": "C", "apartado": [
+            {"nombre": "Actos inscritos", "item": items}]}]}]}}}
+        return json.dumps(sumario).encode("utf-8")
+
+    def _act(self, path: str) -> Optional[bytes]:
+        if self.replay is not None:
+            url = parse_qs(urlsplit(path).query).get("u", [""])[0]
+            hit = self.replay.get(url)
+            return hit[0] if hit else None
+        _, _, day, i = path.split("/")
+        return self._day_pages(day)[int(i)].encode("utf-8")
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes = b"", ctype: str = "text/plain", extra: Optional[Dict[str, str]] = None):
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (extra or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                    fail = server._rnd.random() < server.error_rate
+                    delay = max(server.latency + server._rnd.uniform(-server.jitter, server.jitter), 0.0)
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    with server._lock:
+                        server.errors += 1
+                    return self._send(503, b"error inyectado", extra={"Retry-After": "0"})
+                if self.path.startswith(server.sumario_prefix):
+                    body = server._sumario(self.path.rsplit("/", 1)[1])
+                    ctype = "application/json"
+                elif self.path.startswith("/act"):
+                    body = server._act(self.path)
+                    ctype = "text/html; charset=utf-8"
+                else:
+                    body = None
+                if body is None:
+                    return self._send(404)
+                self._send(200, body, ctype)
+
+        return Handler
+
+def _pipeline_worker(cfg: Dict[str, Any], out) -> None:
+    """
+    Ejecuta una configuración (motor, workers, jobs) en un proceso nuevo, para medir CPU y RSS
+    máximo por separado, con una DB temporal y sin caché.
+    """
+    import resource
+    # Los shards de backfill y el pool del motor async usan el método de arranque habitual de la
+    # plataforma (en un proceso "spawn" el predeterminado pasaría a ser spawn)
+    multiprocessing.set_start_method(cfg["start_method"], force=True)
+    # El servidor local se pasa como --source (no parcheando SUMARIO_URL en memoria), así lo reciben
+    # también los shards de backfill aunque arranquen con spawn/forkserver y reimporten el módulo
+    pipeline.configure_source(cfg["source"])
+    probe = pipeline._source_url(pipeline.SUMARIO_URL.format(date=pipeline.yyyymmdd(dt.date.today())))
+    if not probe.startswith(cfg["source"] + "/"):
+        raise SystemExit(f"El benchmark no apunta al BOE local ({probe}); no se consulta boe.es")
+    fechas = [dt.date.fromisoformat(d) for d in cfg["dates"]]
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        pipeline.DB_FILE = os.path.join(tmp, "bench.db")
+        pipeline.set_text_extractor(cfg["extractor"])
+        pipeline.configure_client(cfg["workers"], 0, None)
+        pipeline.configure_cache(None)
+        r0s, r0c = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+        t0 = time.perf_counter()
+        if cfg["engine"] == "backfill":
+            args = pipeline.build_cli().parse_args(
+                ["backfill", "--from", cfg["dates"][0], "--jobs", str(cfg["jobs"]), "--workers", str(cfg["workers"]),
+                 "--rps", "0", "--no-cache", "--all-days", "--report", "", "--extractor", cfg["extractor"],
+                 "--source", cfg["source"]])
+            pipeline._backfill_parallel(args, fechas[0], fechas[-1])
+        else:
+            with sqlite3.connect(pipeline.DB_FILE) as conn:
+                pipeline.ensure_db(conn)
+                if cfg["engine"] == "async":
+                    asyncio.run(pipeline._run_dates_async(conn, fechas, cfg["workers"], {}, {}))
+                else:
+                    for d in fechas:
+                        pipeline.process_date(d, conn, workers=cfg["workers"])
+        secs = time.perf_counter() - t0
+        r1s, r1c = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    st = pipeline.RUN_STATS
+    out.put({
+        "secs": secs,
+        "items": st["parseados"] + st["prefiltrados"] + st["sin_html"],
+        "cpu": (r1s.ru_utime + r1s.ru_stime - r0s.ru_utime - r0s.ru_stime)
+               + (r1c.ru_utime + r1c.ru_stime - r0c.ru_utime - r0c.ru_stime),
+        # ru_maxrss en KB en Linux; el de hijos es el máximo de cualquier proceso hijo (shards, pool async)
+        "rss_mb": r1s.ru_maxrss / 1024,
+        "rss_children_mb": r1c.ru_maxrss / 1024,
+        "dates_ok": st["fechas_ok"],
+        "retries": int(pipeline._CLIENT.stats["retries"]),
+        "errors": int(pipeline._CLIENT.stats["errors"]) + st["fechas_error"],
+    })
+
+def cmd_pipeline(args):
+    server = BoeStandIn(args.acts, args.latency, args.jitter, args.error_rate, args.seed, args.replay).start()
+    try:
+        start = dt.date.fromisoformat(args.start)
+        if args.replay:
+            end = dt.date.fromisoformat(args.end) if args.end else pipeline.madrid_today()
+            dates = server.replay_dates(start, end)
+        else:
+            dates = [start + dt.timedelta(days=i) for i in range(args.days)]
+        if not dates:
+            print("No hay fechas que reproducir", file=sys.stderr)
+            sys.exit(1)
+        configs = [(engine, w, 1) for engine in args.engines if engine != "backfill" for w in args.workers]
+        if "backfill" in args.engines:
+            configs += [("backfill", args.workers[-1], j) for j in args.jobs]
+        print(f"BOE local {server.base_url}: {len(dates)} fechas ({dates[0]} → {dates[-1]}), "
+              f"{'caché ' + args.replay if args.replay else f'{args.acts} actos sintéticos/fecha'}, "
+              f"latencia {args.latency:.0f}±{args.jitter:.0f} ms, errores {args.error_rate:.1%}")
+        print(f"  {'motor':<9}{'workers':>8}{'jobs':>5}{'actos':>8}{'s':>8}{'actos/s':>9}{'CPU ms/acto':>12}"
+              f"{'RSS MB':>8}{'hijos MB':>9}{'reint.':>7}{'errores':>8}")
+        start_method = multiprocessing.get_start_method()
+        ctx = multiprocessing.get_context("spawn")
+        results = []
+        for engine, workers, jobs in configs:
+            out = ctx.Queue()
+            cfg = {"engine": engine, "workers": workers, "jobs": jobs, "extractor": args.extractor,
+                   "source": server.base_url, "dates": [d.isoformat() for d in dates], "start_method": start_method}
+            proc = ctx.Process(target=_pipeline_worker, args=(cfg, out))
+            proc.start()
+            res = out.get()
+            proc.join()
+            res.update(engine=engine, workers=workers, jobs=jobs)
+            results.append(res)
+            print(f"  {engine:<9}{workers:>8}{jobs:>5}{res['items']:>8}{res['secs']:>8.1f}"
+                  f"{res['items'] / max(res['secs'], 1e-9):>9.0f}{res['cpu'] / max(res['items'], 1) * 1000:>12.2f}"
+                  f"{res['rss_mb']:>8.0f}{res['rss_children_mb']:>9.0f}{res['retries']:>7}{res['errors']:>8}")
+        print(f"Peticiones servidas: {server.requests} ({server.errors} errores inyectados)")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        server.stop()
+
+def _csv_list(conv):
+    return lambda s: [conv(x) for x in s.split(",") if x]
+
+def build_cli():
+    p = argparse.ArgumentParser(description="Benchmarks SOCIMI BORME Watcher")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    p_rx = sub.add_parser("regex", help="Throughput de find_adoption frente a la implementación secuencial")
+    p_rx.add_argument("--acts", type=int, default=20000)
+    p_rx.add_argument("--seed", type=int, default=2009)
+    p_rx.set_defaults(func=cmd_regex)
+
+    p_ex = sub.add_parser("extract", help="docs/s de cada extractor HTML y paridad de find_adoption con html5lib")
+    p_ex.add_argument("--acts", type=int, default=2000)
+    p_ex.add_argument("--seed", type=int, default=2009)
+    p_ex.set_defaults(func=cmd_extract)
+
+    p_pl = sub.add_parser("pipeline", help="actos/s, CPU por acto y RSS máximo por motor y concurrencia contra un BOE local")
+    p_pl.add_argument("--engines", type=_csv_list(str), default=["sync", "async", "backfill"],
+                      help="Lista separada por comas: sync, async, backfill")
+    p_pl.add_argument("--workers", type=_csv_list(int), default=[1, 4, 16], help="Descargas en paralelo a probar")
+    p_pl.add_argument("--jobs", type=_csv_list(int), default=[2, 4], help="Procesos de backfill --jobs a probar")
+    p_pl.add_argument("--days", type=int, default=10, help="Fechas sintéticas consecutivas")
+    p_pl.add_argument("--acts", type=int, default=60, help="Actos sintéticos por fecha")
+    p_pl.add_argument("--from", dest="start", default="2024-01-01", help="AAAA-MM-DD primera fecha")
+    p_pl.add_argument("--to", dest="end", help="AAAA-MM-DD última fecha con --replay (por defecto hoy)")
+    p_pl.add_argument("--replay", help="Reproduce las respuestas grabadas en esta caché (.borme_cache) en vez de generarlas")
+    p_pl.add_argument("--latency", type=float, default=20.0, help="Latencia por respuesta (ms)")
+    p_pl.add_argument("--jitter", type=float, default=5.0, help="Variación aleatoria de la latencia (ms)")
+    p_pl.add_argument("--error-rate", type=float, default=0.0, help="Proporción de respuestas 503")
+    p_pl.add_argument("--extractor", choices=sorted(pipeline.TEXT_EXTRACTORS), default=pipeline.DEFAULT_EXTRACTOR)
+    p_pl.add_argument("--seed", type=int, default=2009)
+    p_pl.add_argument("--json", help="Guarda los resultados en este fichero JSON")
+    p_pl.set_defaults(func=cmd_pipeline)
+
+    return p
+
+if __name__ == "__main__":
+    cli = build_cli()
+    ns = cli.parse_args()
+    ns.func(ns)
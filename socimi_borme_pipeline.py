@@ -6,16 +6,35 @@ Descarga el sumario del BORME por fecha, inspecciona la Sección II (C) y detect
 DB: SQLite local (socimi_borme.db) que quedará versionada en el repo por el workflow.
 """
 from __future__ import annotations
-import sys, os, re, json, time, sqlite3, argparse, datetime as dt
+import sys, os, re, json, math, mmap, time, gzip, zlib, queue, struct, tarfile, zipfile, asyncio, sqlite3, argparse, hashlib, threading, multiprocessing, datetime as dt
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
 from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
 from dateutil import tz
+from dateutil.relativedelta import relativedelta
+from dateutil.easter import easter
 from bs4 import BeautifulSoup
+try:  # opcional: parser HTML más rápido si está instalado
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
 SUMARIO_URL = "https://www.boe.es/datosabiertos/api/borme/sumario/{date}"  # {YYYYMMDD}
 HEADERS = {"Accept": "application/json", "User-Agent": "SOCIMI-BORME-Watcher/1.0"}
 DB_FILE = "socimi_borme.db"
 CSV_FILE = "socimi_borme.csv"
+CORPUS_FILE = "socimi_borme_corpus.db"
+REPORT_FILE = "socimi_borme_report.json"
+CACHE_DIR = os.environ.get("SOCIMI_BORME_CACHE", ".borme_cache")
+CACHE_MAX_MB = float(os.environ.get("SOCIMI_BORME_CACHE_MB", "2048"))
+# Origen de las respuestas: boe.es, otra URL base (espejo) o respuestas grabadas (directorio, .tar o .zip)
+DEFAULT_SOURCE = os.environ.get("SOCIMI_BORME_SOURCE")
 
 # Patrones que indican adopción/entrada al régimen especial SOCIMI (Ley 11/2009)
 ADOPTION_PATTERNS = [
@@ -27,6 +46,16 @@ ADOPTION_PATTERNS = [
     r"\br[ée]gimen\s+fiscal\s+especial\s+de\s+las?\s+SOCIMI\b",
 ]
 ADOPTION_REGEXES = [re.compile(pat, re.IGNORECASE | re.DOTALL) for pat in ADOPTION_PATTERNS]
+# Todos los patrones exigen "SOCIMI" o "Ley 11/2009": si el texto no contiene ninguno de los dos
+# literales no hace falta ejecutar los patrones caros (con .* greedy sobre todo el documento).
+ADOPTION_PREFILTER = re.compile(r"socimi|11/2009", re.IGNORECASE)
+# re.IGNORECASE iguala ſ/İ/ı con s/i pero str.lower() no: solo entonces se recurre a la regex
+_FOLD_EXOTIC = ("\u017f", "\u0130", "\u0131")
+
+def adoption_candidate(text: str) -> bool:
+    if "11/2009" in text or "socimi" in text.lower():
+        return True
+    return any(ch in text for ch in _FOLD_EXOTIC) and ADOPTION_PREFILTER.search(text) is not None
 
 def madrid_today() -> dt.date:
     tz_madrid = tz.gettz("Europe/Madrid")
@@ -36,7 +65,7 @@ def madrid_today() -> dt.date:
 def yyyymmdd(d: dt.date) -> str:
     return d.strftime("%Y%m%d")
 
-def ensure_db(conn: sqlite3.Connection) -> None:
+def _migrate_base(conn: sqlite3.Connection) -> None:
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS socimi_events (
@@ -51,33 +80,1028 @@ def ensure_db(conn: sqlite3.Connection) -> None:
         );
         """
     )
+    # Registro de fechas procesadas: status = ok | sin_sumario | error
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS borme_dates (
+            fecha TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            items INTEGER,
+            sumario_hash TEXT,
+            finished_at TEXT
+        );
+        """
+    )
+    # Punto de reanudación dentro de una fecha: último identificador procesado (status 'en_curso')
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(borme_dates)")}
+    if "checkpoint" not in cols:
+        conn.execute("ALTER TABLE borme_dates ADD COLUMN checkpoint TEXT")
+
+def _migrate_companies(conn: sqlite3.Connection) -> None:
+    """
+    Sociedades en su propia tabla: socimi_events guarda company_id y la vista socimi_events_v
+    ofrece las columnas de siempre (company incluida) para consultas y export.
+    """
+    conn.execute("CREATE TABLE companies (company_id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    conn.execute("INSERT INTO companies (name) SELECT DISTINCT company FROM socimi_events WHERE company IS NOT NULL")
+    conn.execute(
+        """
+        CREATE TABLE socimi_events_new (
+            id TEXT PRIMARY KEY,
+            pub_date TEXT NOT NULL,
+            company_id INTEGER REFERENCES companies (company_id),
+            apartado TEXT,
+            url_html TEXT,
+            url_pdf TEXT,
+            matched_pattern TEXT,
+            excerpt TEXT
+        );
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO socimi_events_new
+        SELECT e.id, e.pub_date, c.company_id, e.apartado, e.url_html, e.url_pdf, e.matched_pattern, e.excerpt
+        FROM socimi_events e LEFT JOIN companies c ON c.name = e.company
+        """
+    )
+    conn.execute("DROP TABLE socimi_events")
+    conn.execute("ALTER TABLE socimi_events_new RENAME TO socimi_events")
+    conn.execute(
+        """
+        CREATE VIEW socimi_events_v AS
+        SELECT e.id, e.pub_date, c.name AS company, e.apartado, e.url_html, e.url_pdf, e.matched_pattern, e.excerpt
+        FROM socimi_events e LEFT JOIN companies c ON c.company_id = e.company_id
+        """
+    )
+
+def _migrate_query_indexes(conn: sqlite3.Connection) -> None:
+    # export ordena por (pub_date, id); los análisis filtran por sociedad y por patrón
+    conn.execute("CREATE INDEX idx_events_date_id ON socimi_events (pub_date, id)")
+    conn.execute("CREATE INDEX idx_events_company ON socimi_events (company_id)")
+    conn.execute("CREATE INDEX idx_events_pattern ON socimi_events (matched_pattern)")
+
+# Migraciones en orden; PRAGMA user_version guarda cuántas se han aplicado (0 = DB anterior al
+# versionado, cuyo esquema coincide con _migrate_base). Solo se añaden al final, nunca se editan.
+MIGRATIONS = [_migrate_base, _migrate_companies, _migrate_query_indexes]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def ensure_db(conn: sqlite3.Connection) -> None:
+    # WAL + synchronous=NORMAL: un commit no espera fsync del fichero principal; la DB sigue
+    # siendo consistente tras un corte (como mucho se pierde la última transacción).
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.commit()
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"{DB_FILE} tiene esquema v{version}, más reciente que este script (v{SCHEMA_VERSION})")
+    for v in range(version + 1, SCHEMA_VERSION + 1):
+        # Cada migración y su número de versión, en una única transacción
+        conn.execute("BEGIN")
+        try:
+            MIGRATIONS[v - 1](conn)
+            conn.execute(f"PRAGMA user_version = {v}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if _INDEX_TEXTS:
+        ensure_fts(conn)
     conn.commit()
 
-def save_event(conn: sqlite3.Connection, rec: Dict[str, Any]) -> None:
+def ledger_mark(conn: sqlite3.Connection, fecha: dt.date, status: str,
+                items: Optional[int] = None, sumario_hash: Optional[str] = None, commit: bool = True,
+                checkpoint: Optional[str] = None) -> None:
     conn.execute(
         """
-        INSERT INTO socimi_events (id, pub_date, company, apartado, url_html, url_pdf, matched_pattern, excerpt)
-        VALUES (:id, :pub_date, :company, :apartado, :url_html, :url_pdf, :matched_pattern, :excerpt)
-        ON CONFLICT(id) DO UPDATE SET
-            pub_date=excluded.pub_date,
-            company=excluded.company,
-            apartado=excluded.apartado,
-            url_html=excluded.url_html,
-            url_pdf=excluded.url_pdf,
-            matched_pattern=excluded.matched_pattern,
-            excerpt=excluded.excerpt
+        INSERT INTO borme_dates (fecha, status, items, sumario_hash, finished_at, checkpoint)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(fecha) DO UPDATE SET
+            status=excluded.status,
+            items=excluded.items,
+            sumario_hash=excluded.sumario_hash,
+            finished_at=excluded.finished_at,
+            -- Un error conserva el checkpoint anterior: el reintento reanuda tras el último lote guardado
+            checkpoint=CASE WHEN excluded.status = 'error'
+                            THEN COALESCE(excluded.checkpoint, borme_dates.checkpoint)
+                            ELSE excluded.checkpoint END
         """,
-        rec,
+        (fecha.isoformat(), status, items, sumario_hash, dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"), checkpoint),
     )
+    if status != "en_curso":
+        count_stat(f"fechas_{status}")
+    if commit:
+        conn.commit()
+
+def pending_dates(conn: sqlite3.Connection, start: dt.date, end: dt.date) -> List[dt.date]:
+    """
+    Fechas del rango sin entrada 'ok' en borme_dates (nunca vistas, fallidas o sin sumario todavía).
+    """
+    cur = conn.execute(
+        "SELECT fecha FROM borme_dates WHERE status = 'ok' AND fecha BETWEEN ? AND ?",
+        (start.isoformat(), end.isoformat()),
+    )
+    done = {row[0] for row in cur}
+    return [d for d in daterange(start, end) if d.isoformat() not in done]
+
+# Calendario de publicación del BORME: de lunes a viernes salvo festivos nacionales.
+# Fiestas nacionales de fecha fija (mes, día); el Viernes Santo se calcula con la Pascua.
+NATIONAL_HOLIDAYS = [(1, 1), (1, 6), (5, 1), (8, 15), (10, 12), (11, 1), (12, 6), (12, 8), (12, 25)]
+# Caché negativa de sumarios (404) sobre borme_dates: un 404 observado cuando la fecha ya tenía
+# más de una semana es definitivo (día sin BORME no previsto en el calendario: traslados de
+# festivos, etc.); los más recientes caducan y se vuelven a consultar.
+LEARNED_404_AFTER_DAYS = 7
+NEGATIVE_TTL_RECENT = dt.timedelta(minutes=float(os.environ.get("SOCIMI_BORME_NEGATIVE_TTL_MIN", "60")))  # hoy/ayer
+NEGATIVE_TTL_WEEK = dt.timedelta(hours=12)
+
+def is_national_holiday(d: dt.date) -> bool:
+    return (d.month, d.day) in NATIONAL_HOLIDAYS or d == easter(d.year) - dt.timedelta(days=2)
+
+def negative_cached_dates(conn: sqlite3.Connection, ttl_recent: dt.timedelta = NEGATIVE_TTL_RECENT) -> set:
+    """
+    Fechas con 404 aún vigente: definitivo si se observó con más de una semana de antigüedad,
+    ttl_recent para hoy/ayer y NEGATIVE_TTL_WEEK para el resto de la última semana.
+    """
+    today = madrid_today()
+    now = dt.datetime.now(dt.timezone.utc)
+    out = set()
+    for fecha, finished_at in conn.execute("SELECT fecha, finished_at FROM borme_dates WHERE status = 'sin_sumario'"):
+        d = dt.date.fromisoformat(fecha)
+        checked = dt.datetime.fromisoformat(finished_at)
+        if (checked.date() - d).days > LEARNED_404_AFTER_DAYS:
+            out.add(d)
+        elif now - checked < (ttl_recent if (today - d).days <= 1 else NEGATIVE_TTL_WEEK):
+            out.add(d)
+    return out
+
+def is_publication_day(d: dt.date) -> bool:
+    return d.weekday() < 5 and not is_national_holiday(d)
+
+def dates_to_process(conn: sqlite3.Connection, start: dt.date, end: dt.date, full: bool = False,
+                     all_days: bool = False, ttl_recent: dt.timedelta = NEGATIVE_TTL_RECENT) -> List[dt.date]:
+    """
+    Fechas a procesar en [start, end]: las pendientes (o todas con full) que sean días de
+    publicación del BORME (o todas con all_days) y sin 404 vigente en la caché negativa.
+    """
+    fechas = list(daterange(start, end)) if full else pending_dates(conn, start, end)
+    if not all_days:
+        before = len(fechas)
+        fechas = [d for d in fechas if is_publication_day(d)]
+        count_stat("fechas_fuera_calendario", before - len(fechas))
+    if not full:
+        negative = negative_cached_dates(conn, ttl_recent)
+        before = len(fechas)
+        fechas = [d for d in fechas if d not in negative]
+        count_stat("cache_negativa", before - len(fechas))
+    return fechas
+
+def ledger_checkpoints(conn: sqlite3.Connection, fechas: Iterable[dt.date]) -> Dict[dt.date, str]:
+    """
+    Último identificador procesado de las fechas a medias ('en_curso', o 'error' tras algún lote
+    guardado), para reanudar tras él.
+    """
+    wanted = {d.isoformat(): d for d in fechas}
+    cur = conn.execute("SELECT fecha, checkpoint FROM borme_dates "
+                       "WHERE status IN ('en_curso', 'error') AND checkpoint IS NOT NULL")
+    return {wanted[f]: ident for f, ident in cur if f in wanted}
+
+def ledger_hashes(conn: sqlite3.Connection, fechas: Iterable[dt.date]) -> Dict[dt.date, str]:
+    """
+    Hash del sumario de las fechas ya completadas ('ok').
+    """
+    wanted = {d.isoformat(): d for d in fechas}
+    cur = conn.execute("SELECT fecha, sumario_hash FROM borme_dates WHERE status = 'ok' AND sumario_hash IS NOT NULL")
+    return {wanted[f]: h for f, h in cur if f in wanted}
+
+def sumario_hash(sumario: Dict[str, Any]) -> str:
+    raw = json.dumps(sumario, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+UPSERT_COMPANY_SQL = "INSERT OR IGNORE INTO companies (name) SELECT :company WHERE :company IS NOT NULL"
+UPSERT_EVENT_SQL = """
+    INSERT INTO socimi_events (id, pub_date, company_id, apartado, url_html, url_pdf, matched_pattern, excerpt)
+    VALUES (:id, :pub_date, (SELECT company_id FROM companies WHERE name = :company),
+            :apartado, :url_html, :url_pdf, :matched_pattern, :excerpt)
+    ON CONFLICT(id) DO UPDATE SET
+        pub_date=excluded.pub_date,
+        company_id=excluded.company_id,
+        apartado=excluded.apartado,
+        url_html=excluded.url_html,
+        url_pdf=excluded.url_pdf,
+        matched_pattern=excluded.matched_pattern,
+        excerpt=excluded.excerpt
+"""
+
+def upsert_events(conn: sqlite3.Connection, recs: List[Dict[str, Any]]) -> None:
+    """
+    Inserta o actualiza eventos (registros con "company" como texto), dando de alta sus sociedades. Sin commit.
+    """
+    conn.executemany(UPSERT_COMPANY_SQL, recs)
+    conn.executemany(UPSERT_EVENT_SQL, recs)
+
+def save_event(conn: sqlite3.Connection, rec: Dict[str, Any]) -> None:
+    upsert_events(conn, [rec])
     conn.commit()
 
+def ensure_fts(conn: sqlite3.Connection) -> None:
+    """
+    Índice de texto completo de los actos (opcional: solo se crea con --index-text o el comando index).
+    act_docs asigna a cada identificador el rowid de act_fts, así reindexar una fecha no duplica filas.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS act_docs (
+            docid INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            pub_date TEXT NOT NULL,
+            company TEXT,
+            url_html TEXT
+        );
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_act_docs_date ON act_docs (pub_date)")
+    # remove_diacritics: "regimen" encuentra "régimen"
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS act_fts USING fts5(company, text, tokenize='unicode61 remove_diacritics 2')"
+    )
+
+def index_texts(conn: sqlite3.Connection, recs: Iterable[Dict[str, Any]]) -> int:
+    """
+    Añade al índice los actos que aún no estén (sin commit: va en la transacción del lote).
+    """
+    n = 0
+    for r in recs:
+        cur = conn.execute("INSERT OR IGNORE INTO act_docs (id, pub_date, company, url_html) VALUES (?, ?, ?, ?)",
+                           (r["id"], r["pub_date"], r.get("company"), r.get("url_html")))
+        if cur.rowcount:
+            conn.execute("INSERT INTO act_fts (rowid, company, text) VALUES (?, ?, ?)",
+                         (cur.lastrowid, r.get("company"), r["text"]))
+            n += 1
+    return n
+
+class EventWriter:
+    """
+    Acumula eventos y los escribe con executemany en una sola transacción: al llamar a flush()
+    (fin de cada fecha) o antes si se superan max_rows filas o max_seconds segundos.
+    """
+    def __init__(self, conn: sqlite3.Connection, max_rows: int = 500, max_seconds: float = 30.0):
+        self.conn = conn
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self._buf: List[Dict[str, Any]] = []
+        self._since = time.monotonic()
+
+    def add(self, rec: Dict[str, Any]) -> None:
+        if not self._buf:
+            self._since = time.monotonic()
+        self._buf.append(rec)
+        if len(self._buf) >= self.max_rows or time.monotonic() - self._since >= self.max_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Escribe lo pendiente y hace commit (incluye cualquier cambio previo sin confirmar de la conexión).
+        """
+        if self._buf:
+            upsert_events(self.conn, self._buf)
+            self._buf = []
+        self.conn.commit()
+
+class TokenBucket:
+    """
+    Limitador de peticiones a boe.es por cubo de tokens: hasta `burst` peticiones seguidas y
+    después `rate` por segundo. La tasa es adaptativa: se reduce a la mitad ante 429/503 o
+    errores de conexión y se recupera poco a poco (sin pasar de `rps`) con latencias sanas.
+    Con shared=True el estado vive en memoria compartida (backfill --jobs, heredado por los hijos).
+    """
+    HEALTHY_SECONDS = 1.0
+    _RATE, _TOKENS, _LAST, _THROTTLED, _DECREASES = range(5)
+
+    def __init__(self, rps: float, burst: Optional[float] = None, shared: bool = False):
+        self.max_rps = rps if rps and rps > 0 else 0.0
+        self.min_rps = self.max_rps / 16
+        self.burst = max(burst or self.max_rps, 1.0)
+        state = [self.max_rps, self.burst, time.monotonic(), 0.0, 0.0]
+        if shared:
+            self._state = multiprocessing.Array("d", state)
+            self._lock = self._state.get_lock()
+        else:
+            self._state = state
+            self._lock = threading.Lock()
+
+    def wait(self, url: str) -> float:
+        """
+        Bloquea hasta disponer de un token. Devuelve los segundos esperados.
+        """
+        if not self.max_rps:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                st = self._state
+                now = time.monotonic()
+                tokens = min(self.burst, st[self._TOKENS] + (now - st[self._LAST]) * st[self._RATE])
+                st[self._LAST] = now
+                if tokens >= 1.0:
+                    st[self._TOKENS] = tokens - 1.0
+                    st[self._THROTTLED] += waited
+                    return waited
+                st[self._TOKENS] = tokens
+                delay = (1.0 - tokens) / st[self._RATE]
+            time.sleep(delay)
+            waited += delay
+
+    def feedback(self, status: Optional[int], elapsed: float) -> None:
+        """
+        Ajusta la tasa tras cada respuesta (status None = error de conexión).
+        """
+        if not self.max_rps:
+            return
+        with self._lock:
+            st = self._state
+            if status is None or status in (429, 503):
+                st[self._RATE] = max(self.min_rps, st[self._RATE] / 2)
+                st[self._DECREASES] += 1
+            elif status < 500 and elapsed < self.HEALTHY_SECONDS:
+                st[self._RATE] = min(self.max_rps, st[self._RATE] + self.max_rps / 50)
+
+    def summary(self) -> str:
+        if not self.max_rps:
+            return "Límite de peticiones: desactivado"
+        st = self._state
+        return (f"Límite de peticiones: {st[self._THROTTLED]:.1f}s en espera, tasa actual {st[self._RATE]:.2f}/{self.max_rps:g} rps, "
+                f"{int(st[self._DECREASES])} reducciones por 429/503")
+
+DEFAULT_WORKERS = 4
+DEFAULT_RPS = float(os.environ.get("SOCIMI_BORME_RPS", "5"))
+DEFAULT_BURST = float(os.environ.get("SOCIMI_BORME_BURST", "0")) or None
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def _retry_after(r: requests.Response) -> Optional[float]:
+    val = r.headers.get("Retry-After")
+    if not val:
+        return None
+    try:
+        return max(float(val), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(val)
+    except (TypeError, ValueError):
+        return None
+    return max((when - dt.datetime.now(dt.timezone.utc)).total_seconds(), 0.0)
+
+class BoeClient:
+    """
+    Cliente HTTP único para boe.es: sesión con keep-alive, pool dimensionado a los workers,
+    reintentos con backoff exponencial (respetando Retry-After) y tiempos por petición.
+    """
+    def __init__(self, workers: int = DEFAULT_WORKERS, rps: float = DEFAULT_RPS, burst: Optional[float] = DEFAULT_BURST,
+                 max_retries: int = 4, backoff: float = 1.0, timeout: float = 30):
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(workers, 1))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.limiter = TokenBucket(rps, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {"requests": 0, "retries": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0}
+
+    def _record(self, elapsed: float, retry: bool = False, error: bool = False) -> None:
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["seconds"] += elapsed
+            self.stats["max_seconds"] = max(self.stats["max_seconds"], elapsed)
+            if retry:
+                self.stats["retries"] += 1
+            if error:
+                self.stats["errors"] += 1
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        attempt = 0
+        while True:
+            self.limiter.wait(url)
+            t0 = time.perf_counter()
+            try:
+                r = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                retry = attempt < self.max_retries
+                elapsed = time.perf_counter() - t0
+                self.limiter.feedback(None, elapsed)
+                self._record(elapsed, retry=retry, error=not retry)
+                METRICS.observe("peticion_http", elapsed)
+                if not retry:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                continue
+            retry = r.status_code in RETRY_STATUS and attempt < self.max_retries
+            elapsed = time.perf_counter() - t0
+            self.limiter.feedback(r.status_code, elapsed)
+            # Un 429/5xx que sigue tras agotar los reintentos también cuenta como error
+            self._record(elapsed, retry=retry, error=r.status_code in RETRY_STATUS and not retry)
+            METRICS.observe("peticion_http", elapsed)
+            if not retry:
+                return r
+            delay = _retry_after(r)
+            time.sleep(min(delay if delay is not None else self.backoff * 2 ** attempt, 120.0))
+            attempt += 1
+
+    def summary(self) -> str:
+        st = self.stats
+        avg = st["seconds"] / st["requests"] * 1000 if st["requests"] else 0.0
+        return (f"HTTP: {int(st['requests'])} peticiones, {int(st['retries'])} reintentos, "
+                f"{int(st['errors'])} errores, media {avg:.0f} ms, máx {st['max_seconds'] * 1000:.0f} ms")
+
+_CLIENT = BoeClient()
+
+def configure_client(workers: int = DEFAULT_WORKERS, rps: float = DEFAULT_RPS,
+                     burst: Optional[float] = DEFAULT_BURST) -> BoeClient:
+    global _CLIENT
+    _CLIENT = BoeClient(workers=workers, rps=rps, burst=burst)
+    return _CLIENT
+
+class DiskCache:
+    """
+    Caché en disco de respuestas 200 de boe.es (sumarios y actos publicados no cambian).
+    Clave = sha256(url); cuerpo gzip + metadatos JSON (ETag, Last-Modified, encoding).
+    Expulsión LRU por mtime (se actualiza en cada acierto) hasta caber en max_bytes.
+    """
+    def __init__(self, root: str = CACHE_DIR, max_mb: float = CACHE_MAX_MB):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.root, key[:2], key)
+        return base + ".gz", base + ".json"
+
+    def get(self, url: str) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with gzip.open(body_path, "rb") as f:
+                body = f.read()
+            os.utime(body_path)
+        except (OSError, ValueError, EOFError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return body, meta
+
+    def put(self, url: str, body: bytes, meta: Dict[str, Any]) -> None:
+        body_path, meta_path = self._paths(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        tmp = f"{body_path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wb", compresslevel=6) as f:
+            f.write(body)
+        os.replace(tmp, body_path)
+        tmp = f"{meta_path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dict(meta, url=url, size=len(body)), f, ensure_ascii=False)
+        os.replace(tmp, meta_path)
+        added = os.path.getsize(body_path) + os.path.getsize(meta_path)
+        with self._lock:
+            if self._size is None:
+                self._size = self.stats()["bytes"]
+            else:
+                self._size += added
+            over = self._size > self.max_bytes
+        if over:
+            self.prune(int(self.max_bytes * 0.9))
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for d in os.scandir(self.root):
+            if not d.is_dir():
+                continue
+            for e in os.scandir(d.path):
+                if not e.name.endswith(".gz"):
+                    continue
+                st = e.stat()
+                meta_path = e.path[:-3] + ".json"
+                try:
+                    size = st.st_size + os.path.getsize(meta_path)
+                except OSError:
+                    size = st.st_size
+                out.append((st.st_mtime, size, e.path))
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(e[1] for e in entries),
+            "oldest": min((e[0] for e in entries), default=None),
+            "newest": max((e[0] for e in entries), default=None),
+        }
+
+    def prune(self, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Elimina las entradas menos usadas recientemente hasta quedar por debajo de max_bytes.
+        Devuelve (entradas eliminadas, bytes liberados).
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries())
+        total = sum(e[1] for e in entries)
+        removed = freed = 0
+        for _, size, body_path in entries:
+            if total <= limit:
+                break
+            for path in (body_path, body_path[:-3] + ".json"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            removed += 1
+            freed += size
+        with self._lock:
+            self._size = total
+        return removed, freed
+
+_CACHE: Optional[DiskCache] = None
+
+# Contadores de la ejecución (actos prefiltrados, parseados...), compartidos entre hilos
+RUN_STATS: Counter = Counter()
+_STATS_LOCK = threading.Lock()
+
+def count_stat(key: str, n: int = 1) -> None:
+    with _STATS_LOCK:
+        RUN_STATS[key] += n
+
+class Histogram:
+    """
+    Histograma de duraciones con cubetas logarítmicas (factor 1.1, error relativo < 5%): memoria
+    constante sea cual sea el número de muestras y se puede sumar entre procesos.
+    """
+    BASE = 1.1
+    MIN_SECONDS = 1e-6
+
+    def __init__(self, state: Optional[Dict[str, Any]] = None):
+        self.buckets: Counter = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        if state:
+            self.merge(state)
+
+    def add(self, secs: float) -> None:
+        self.buckets[int(math.log(max(secs, self.MIN_SECONDS) / self.MIN_SECONDS, self.BASE))] += 1
+        self.count += 1
+        self.total += secs
+        self.max = max(self.max, secs)
+
+    def merge(self, state: Dict[str, Any]) -> None:
+        self.buckets.update({int(k): v for k, v in state["buckets"].items()})
+        self.count += state["count"]
+        self.total += state["total"]
+        self.max = max(self.max, state["max"])
+
+    def state(self) -> Dict[str, Any]:
+        return {"buckets": dict(self.buckets), "count": self.count, "total": self.total, "max": self.max}
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= rank:
+                return min(self.MIN_SECONDS * self.BASE ** (b + 0.5), self.max)
+        return self.max
+
+class Metrics:
+    """
+    Tiempos por etapa (sumario, HTML, extracción, patrones, escritura...) como histogramas, seguros
+    entre hilos. Los contadores siguen en RUN_STATS.
+    """
+    def __init__(self):
+        self.hists: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, secs: float) -> None:
+        with self._lock:
+            self.hists.setdefault(name, Histogram()).add(secs)
+
+    @contextmanager
+    def timer(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: h.state() for name, h in self.hists.items()}
+
+    def merge(self, snapshot: Dict[str, Dict[str, Any]]) -> None:
+        with self._lock:
+            for name, state in snapshot.items():
+                self.hists.setdefault(name, Histogram()).merge(state)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.hists.clear()
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {"n": h.count, "total_s": round(h.total, 3),
+                       **{f"p{int(q * 100)}_ms": round(h.quantile(q) * 1000, 2) for q in (0.5, 0.95, 0.99)},
+                       "max_ms": round(h.max * 1000, 2)}
+                for name, h in sorted(self.hists.items())
+            }
+
+METRICS = Metrics()
+
+def configure_cache(root: Optional[str], max_mb: float = CACHE_MAX_MB) -> Optional[DiskCache]:
+    global _CACHE
+    _CACHE = DiskCache(root, max_mb) if root else None
+    return _CACHE
+
+# Sumarios de hoy y ayer: se revalidan con GET condicional en vez de servirse de la caché sin más
+REVALIDATE_DAYS = 1
+_REVALIDATE_ALL = False
+
+def set_revalidate_all(flag: bool) -> None:
+    global _REVALIDATE_ALL
+    _REVALIDATE_ALL = flag
+
+BUNDLE_MAGIC = b"BORMEB1\n"
+BUNDLE_FOOTER = struct.Struct("<QQ8s")  # offset y longitud del índice, marca final
+BUNDLE_END = b"BORMEIX1"
+
+def bundle_path(root: str, fecha: str) -> str:
+    day = fecha.replace("-", "")
+    return os.path.join(root, day[:4], f"{day}.borme")
+
+BUNDLE_CODECS = ("zlib", "raw")
+
+class Bundle:
+    """
+    Lector de un paquete diario de --record: cabecera, respuestas una tras otra (comprimidas con zlib
+    o sin comprimir, "raw"), índice JSON {url: [offset, longitud, tamaño original, metadatos, códec]}
+    y pie de tamaño fijo con la posición del índice. El fichero se mapea en memoria: view() no copia
+    los bytes de un registro raw, y al cerrar se libera todo lo leído.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        index_offset, index_len, end = BUNDLE_FOOTER.unpack(self._mm[-BUNDLE_FOOTER.size:])
+        if self._mm[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC or end != BUNDLE_END:
+            self.close()
+            raise ValueError(f"{path} no es un paquete BORME")
+        index = json.loads(zlib.decompress(self._mm[index_offset:index_offset + index_len]))
+        self.fecha: str = index["fecha"]
+        self.records: Dict[str, List[Any]] = index["records"]
+
+    @staticmethod
+    def codec(entry: List[Any]) -> str:
+        return entry[4] if len(entry) > 4 else "zlib"
+
+    def read_raw(self, url: str) -> Optional[bytes]:
+        """
+        Bytes tal como están guardados (sin descomprimir).
+        """
+        entry = self.records.get(url)
+        return self._mm[entry[0]:entry[0] + entry[1]] if entry is not None else None
+
+    def view(self, url: str) -> Optional[Any]:
+        """
+        Cuerpo de la respuesta sin copias evitables: memoryview sobre el fichero mapeado si es raw;
+        si es zlib, los bytes descomprimidos leyendo directamente del mapa.
+        """
+        entry = self.records.get(url)
+        if entry is None:
+            return None
+        mv = memoryview(self._mm)[entry[0]:entry[0] + entry[1]]
+        if self.codec(entry) == "raw":
+            return mv
+        with mv:
+            return zlib.decompress(mv)
+
+    def get(self, url: str) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        entry = self.records.get(url)
+        if entry is None:
+            return None
+        raw = self.read_raw(url)
+        return (raw if self.codec(entry) == "raw" else zlib.decompress(raw)), entry[3]
+
+    def close(self) -> None:
+        try:
+            self._mm.close()
+        except BufferError:
+            pass  # quedan memoryview vivas: el mapa se libera cuando desaparezcan
+        self._f.close()
+
+class BundleWriter:
+    """
+    Paquete de una fecha en construcción: las respuestas se añaden a un temporal según llegan
+    (desde cualquier hilo); close() añade las del paquete anterior que no se hayan vuelto a pedir,
+    escribe índice y pie y lo sustituye de forma atómica.
+    """
+    def __init__(self, root: str, fecha: str, codec: str = "zlib"):
+        self.path = bundle_path(root, fecha)
+        self.fecha = fecha
+        self.codec = codec
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._tmp = f"{self.path}.{os.getpid()}.tmp"
+        self._f = open(self._tmp, "wb")
+        self._f.write(BUNDLE_MAGIC)
+        self._records: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def _append(self, url: str, data: bytes, size: int, meta: Dict[str, Any], codec: str) -> None:
+        with self._lock:
+            if url in self._records:
+                return
+            self._records[url] = [self._f.tell(), len(data), size, meta, codec]
+            self._f.write(data)
+
+    def add(self, url: str, body: bytes, meta: Dict[str, Any]) -> None:
+        keep = {k: meta[k] for k in ("content_type", "encoding", "etag", "last_modified") if meta.get(k)}
+        data = zlib.compress(body, 6) if self.codec == "zlib" else body
+        self._append(url, data, len(body), keep, self.codec)
+
+    def close(self) -> int:
+        if os.path.exists(self.path):
+            old = Bundle(self.path)
+            try:
+                for url, entry in old.records.items():
+                    self._append(url, old.read_raw(url), entry[2], entry[3], Bundle.codec(entry))
+            finally:
+                old.close()
+        index = zlib.compress(json.dumps({"fecha": self.fecha, "records": self._records}).encode("utf-8"), 6)
+        offset = self._f.tell()
+        self._f.write(index)
+        self._f.write(BUNDLE_FOOTER.pack(offset, len(index), BUNDLE_END))
+        self._f.close()
+        os.replace(self._tmp, self.path)
+        return len(self._records)
+
+class Recorder:
+    """
+    run/backfill --record DIR: guarda cada sumario y HTML de acto usados (de red, caché o --source)
+    en un paquete por fecha, DIR/AAAA/AAAAMMDD.borme, que se cierra al terminar la fecha.
+    """
+    def __init__(self, root: str, codec: str = "zlib"):
+        self.root = root
+        self.codec = codec
+        self._open: Dict[str, BundleWriter] = {}
+        self._lock = threading.Lock()
+
+    def has(self, fecha: dt.date) -> bool:
+        return os.path.exists(bundle_path(self.root, fecha.isoformat()))
+
+    def add(self, fecha: str, url: str, body: bytes, meta: Dict[str, Any]) -> None:
+        with self._lock:
+            writer = self._open.get(fecha) or self._open.setdefault(fecha, BundleWriter(self.root, fecha, self.codec))
+        writer.add(url, body, meta)
+
+    def finish(self, fecha: dt.date) -> None:
+        with self._lock:
+            writer = self._open.pop(fecha.isoformat(), None)
+        if writer is not None:
+            n = writer.close()
+            count_stat("paquetes_grabados")
+            count_stat("respuestas_grabadas", n)
+
+_RECORDER: Optional[Recorder] = None
+
+def _recorded_only(by_date: Dict[dt.date, str]) -> Dict[dt.date, str]:
+    """
+    Con --record, checkpoints y hashes ya conocidos solo valen para fechas que ya tienen paquete;
+    las demás se procesan enteras para que su paquete quede completo.
+    """
+    if _RECORDER is None:
+        return by_date
+    return {d: v for d, v in by_date.items() if _RECORDER.has(d)}
+
+def configure_recorder(root: Optional[str], codec: str = "zlib") -> Optional[Recorder]:
+    global _RECORDER
+    _RECORDER = Recorder(root, codec) if root else None
+    return _RECORDER
+
+class SourceMiss(requests.RequestException):
+    """
+    La URL no está entre las respuestas grabadas de --source (no implica que no exista en boe.es).
+    """
+
+class ReplaySource:
+    """
+    Respuestas grabadas, sin red: un directorio de paquetes de --record (AAAA/AAAAMMDD.borme), o un
+    directorio o .tar/.zip con la estructura de la caché (<hh>/<sha256(url)>.gz + .json, como
+    .borme_cache) o un espejo por URL (www.boe.es/ruta?consulta). En archivos se admite un directorio
+    raíz común. Un .tar comprimido obliga a descomprimir desde el principio en cada lectura: mejor
+    .tar sin comprimir o .zip.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._tar: Optional[tarfile.TarFile] = None
+        self._members: Dict[str, Any] = {}
+        # Paquetes de --record: solo se abren (mapean) los de las últimas fechas pedidas, así la
+        # memoria no crece con el tamaño del archivo
+        self._bundle_paths: Dict[str, str] = {}
+        self._bundles: "OrderedDict[str, Bundle]" = OrderedDict()
+        if os.path.isdir(path):
+            for year in sorted(os.listdir(path)):
+                if not (year.isdigit() and os.path.isdir(os.path.join(path, year))):
+                    continue
+                for name in os.listdir(os.path.join(path, year)):
+                    if name.endswith(".borme"):
+                        day = name[:-len(".borme")]
+                        self._bundle_paths[f"{day[:4]}-{day[4:6]}-{day[6:8]}"] = os.path.join(path, year, name)
+            return
+        if zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+            entries = [(i.filename, i) for i in self._zip.infolist() if not i.is_dir()]
+        elif tarfile.is_tarfile(path):
+            self._tar = tarfile.open(path)
+            entries = [(m.name, m) for m in self._tar.getmembers() if m.isfile()]
+        else:
+            raise ValueError(f"--source {path}: no es una URL, un directorio ni un .tar/.zip")
+        for name, member in entries:
+            name = name[2:] if name.startswith("./") else name
+            self._members[name] = member
+            if "/" in name:
+                self._members.setdefault(name.split("/", 1)[1], member)
+
+    def _read(self, name: str) -> Optional[bytes]:
+        if self._zip is None and self._tar is None:
+            try:
+                with open(os.path.join(self.path, name), "rb") as f:
+                    return f.read()
+            except OSError:
+                return None
+        member = self._members.get(name)
+        if member is None:
+            return None
+        with self._lock:
+            if self._zip is not None:
+                return self._zip.read(member)
+            return self._tar.extractfile(member).read()
+
+    OPEN_BUNDLES = 4
+
+    def bundle_for(self, url: str) -> Optional[Bundle]:
+        """
+        Paquete que contiene la URL: el de su fecha si es un sumario (se abre si hace falta) o, para
+        un acto, uno de los abiertos (sus actos se piden siempre después del sumario).
+        """
+        prefix, _, suffix = SUMARIO_URL.partition("{date}")
+        with self._lock:
+            if url.startswith(prefix) and url.endswith(suffix):
+                day = url[len(prefix):len(url) - len(suffix)]
+                fecha = f"{day[:4]}-{day[4:6]}-{day[6:8]}"
+                if fecha not in self._bundles:
+                    if fecha not in self._bundle_paths:
+                        return None
+                    self._bundles[fecha] = Bundle(self._bundle_paths[fecha])
+                    if len(self._bundles) > self.OPEN_BUNDLES:
+                        self._bundles.popitem(last=False)[1].close()
+                self._bundles.move_to_end(fecha)
+                return self._bundles[fecha]
+            for bundle in reversed(self._bundles.values()):
+                if url in bundle.records:
+                    return bundle
+        return None
+
+    def view(self, url: str) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """
+        Como get() pero sin copiar el cuerpo si viene de un paquete raw (memoryview sobre el mapa).
+        """
+        if self._bundle_paths:
+            bundle = self.bundle_for(url)
+            buf = bundle.view(url) if bundle is not None else None
+            return (buf, bundle.records[url][3]) if buf is not None else None
+        return self.get(url)
+
+    def get(self, url: str) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        if self._bundle_paths:
+            bundle = self.bundle_for(url)
+            return bundle.get(url) if bundle is not None else None
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        body = self._read(f"{key[:2]}/{key}.gz")
+        if body is not None:
+            meta_raw = self._read(f"{key[:2]}/{key}.json")
+            return gzip.decompress(body), json.loads(meta_raw) if meta_raw else {}
+        parts = urlsplit(url)
+        body = self._read(parts.netloc + parts.path + (f"?{parts.query}" if parts.query else ""))
+        return (body, {}) if body is not None else None
+
+    def close(self) -> None:
+        for b in self._bundles.values():
+            b.close()
+        if self._zip is not None:
+            self._zip.close()
+        if self._tar is not None:
+            self._tar.close()
+
+_REPLAY: Optional[ReplaySource] = None
+_SOURCE_BASE: Optional[str] = None
+
+def configure_source(source: Optional[str]) -> None:
+    """
+    None: boe.es. http(s)://...: mismas rutas en otro servidor. Ruta local: respuestas grabadas.
+    """
+    global _REPLAY, _SOURCE_BASE
+    if _REPLAY is not None:
+        _REPLAY.close()
+    _REPLAY, _SOURCE_BASE = None, None
+    if source and re.match(r"https?://", source):
+        _SOURCE_BASE = source.rstrip("/")
+    elif source:
+        _REPLAY = ReplaySource(source)
+
+def _source_url(url: str) -> str:
+    """
+    URL de boe.es (sumario o acto) reescrita a la base de --source; las claves de caché no cambian.
+    """
+    if _SOURCE_BASE is None:
+        return url
+    parts = urlsplit(url)
+    if not parts.netloc.endswith("boe.es"):
+        return url
+    return _SOURCE_BASE + parts.path + (f"?{parts.query}" if parts.query else "")
+
+def _cached_get(url: str, revalidate: bool = False, record: Optional[str] = None) -> Tuple[int, Optional[bytes], Dict[str, Any]]:
+    """
+    GET a través de la caché en disco (si está activa). Devuelve (status, cuerpo, metadatos).
+    Con revalidate (o --revalidate) una entrada en caché se confirma con If-None-Match /
+    If-Modified-Since (GET normal si la entrada no tiene validadores); un 304 devuelve el cuerpo
+    en caché con status 304.
+    Con record (fecha AAAA-MM-DD) y --record la respuesta se guarda en el paquete de esa fecha.
+    """
+    status, body, meta = _fetch(url, revalidate)
+    if record and _RECORDER is not None and body is not None:
+        _RECORDER.add(record, url, body, meta)
+    return status, body, meta
+
+def _fetch(url: str, revalidate: bool) -> Tuple[int, Optional[bytes], Dict[str, Any]]:
+    if _REPLAY is not None:
+        # Sin red ni caché: la copia grabada es la respuesta
+        rec = _REPLAY.get(url)
+        if rec is None:
+            count_stat("no_grabadas")
+            raise SourceMiss(f"{url} no está en {_REPLAY.path}")
+        count_stat("bytes_leidos_local", len(rec[0]))
+        return 200, rec[0], rec[1]
+    cond: Dict[str, str] = {}
+    hit = _CACHE.get(url) if _CACHE is not None else None
+    if hit is not None:
+        meta = hit[1]
+        if not (revalidate or _REVALIDATE_ALL):
+            count_stat("bytes_ahorrados_cache", meta.get("size", len(hit[0])))
+            return 200, hit[0], meta
+        # Sin ETag ni Last-Modified no se puede confirmar la copia: GET normal (y se sustituye si llega un 200)
+        if meta.get("etag"):
+            cond["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            cond["If-Modified-Since"] = meta["last_modified"]
+    r = _CLIENT.get(_source_url(url), headers=cond or None)
+    if r.status_code == 304 and hit is not None:
+        count_stat("respuestas_304")
+        count_stat("bytes_ahorrados_304", hit[1].get("size", len(hit[0])))
+        return 304, hit[0], hit[1]
+    if r.status_code != 200:
+        return r.status_code, None, {}
+    count_stat("bytes_descargados", len(r.content))
+    meta = {
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "content_type": r.headers.get("Content-Type"),
+        "encoding": r.encoding or r.apparent_encoding,
+    }
+    if _CACHE is not None:
+        _CACHE.put(url, r.content, meta)
+    return 200, r.content, meta
+
 def fetch_sumario(fecha: dt.date) -> Optional[Dict[str, Any]]:
     url = SUMARIO_URL.format(date=yyyymmdd(fecha))
-    r = requests.get(url, headers=HEADERS, timeout=30)
-    if r.status_code == 404:
+    recent = fecha >= madrid_today() - dt.timedelta(days=REVALIDATE_DAYS)
+    with METRICS.timer("sumario"):
+        status, body, _ = _cached_get(url, revalidate=recent, record=fecha.isoformat())
+    if status == 404:
         return None
-    r.raise_for_status()
-    return r.json()
+    if status not in (200, 304):
+        raise requests.HTTPError(f"{status} al descargar {url}")
+    return json.loads(body)
 
 def _as_list(x) -> List[Any]:
     if x is None:
@@ -107,23 +1131,215 @@ def iter_section_c_items(sumario: Dict[str, Any]) -> Iterable[Tuple[Dict[str, An
             for item in _as_list(s.get("item")):
                 yield item, None
 
-def fetch_html(url: str) -> Optional[str]:
+# Respuestas que significan que el acto no existe (no se reintentan); cualquier otro fallo es un error
+NOT_FOUND_STATUS = frozenset([404, 410])
+
+def fetch_html_raw(url: str, pub_date: Optional[str] = None) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+    """
+    HTML de un acto, o None si no existe (404/410). Un fallo de red o un error del servidor tras los
+    reintentos se propaga: la fecha no debe darse por terminada con actos sin comprobar.
+    """
     try:
-        r = requests.get(url, headers=HEADERS, timeout=30)
-        if r.status_code == 200:
-            return r.text
-        return None
+        with METRICS.timer("html_acto"):
+            status, body, meta = _cached_get(url, record=pub_date)
     except requests.RequestException:
+        count_stat("actos_fallidos")
+        raise
+    if status in NOT_FOUND_STATUS:
         return None
+    if status not in (200, 304):
+        count_stat("actos_fallidos")
+        raise requests.HTTPError(f"{status} al descargar {url}")
+    return body, meta
 
-def text_from_borme_html(html: str) -> str:
+def fetch_html(url: str) -> Optional[str]:
+    raw = fetch_html_raw(url)
+    return decode_html(*raw) if raw else None
+
+def decode_html(body: bytes, meta: Dict[str, Any]) -> str:
+    # str() acepta también memoryview (paquetes mapeados en memoria) sin copia intermedia a bytes
+    return str(body, meta.get("encoding") or "utf-8", "replace")
+
+SKIP_TAGS = frozenset(["nav", "header", "footer", "script", "style"])
+VOID_TAGS = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param",
+                       "source", "track", "wbr"])
+# Elementos cuyo cierre puede omitirse: html5lib los cierra implícitamente sin mover texto
+IMPLIED_END_TAGS = frozenset(["p", "li", "dt", "dd", "option", "optgroup", "td", "th", "tr", "tbody", "thead",
+                              "tfoot", "caption", "colgroup", "rb", "rt", "rp", "head", "body", "html"])
+# Dentro de estos, html5lib saca fuera de la tabla (foster parenting) el texto y los elementos no tabulares
+TABLE_SCOPE_TAGS = frozenset(["table", "tbody", "thead", "tfoot", "tr"])
+TABLE_CONTENT_TAGS = frozenset(["caption", "colgroup", "col", "tbody", "thead", "tfoot", "tr", "td", "th",
+                                "script", "style", "template", "form", "input"])
+
+def _html5lib_text(html: str) -> str:
     soup = BeautifulSoup(html, "html5lib")
-    for nav in soup.find_all(["nav", "header", "footer", "script", "style"]):
+    for nav in soup.find_all(list(SKIP_TAGS)):
         nav.decompose()
     text = soup.get_text(" ", strip=True)
     return text
 
+class _TextTarget:
+    """
+    Recoge el texto por eventos (sin construir árbol), omitiendo SKIP_TAGS, con la misma
+    normalización que get_text(" ", strip=True): cada nodo de texto se recorta y se une con " ".
+    Sirve de target para lxml y de base para el extractor con html.parser.
+    Lleva la pila de elementos abiertos para detectar lo que html5lib repararía cambiando el texto
+    (contenido suelto en una tabla, cierres huérfanos o mal anidados): entonces close() da None.
+    """
+    def __init__(self):
+        self.parts: List[str] = []
+        self._buf: List[str] = []
+        self._skip = 0
+        self._open: List[str] = []
+        self._malformed = False
+
+    def _flush(self) -> None:
+        if self._buf:
+            chunk = "".join(self._buf).strip()
+            if chunk and not self._skip:
+                self.parts.append(chunk)
+            self._buf = []
+
+    def start(self, tag: str, attrib: Any = None) -> None:
+        self._flush()
+        tag = tag.lower()
+        if self._open and self._open[-1] in TABLE_SCOPE_TAGS and tag not in TABLE_CONTENT_TAGS:
+            self._malformed = True
+        elif tag in ("html", "head", "body") and tag in self._open:
+            self._malformed = True
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        if tag not in VOID_TAGS:
+            self._open.append(tag)
+
+    def end(self, tag: str) -> None:
+        self._flush()
+        tag = tag.lower()
+        if tag in SKIP_TAGS and self._skip:
+            self._skip -= 1
+        if tag in VOID_TAGS:
+            return
+        if tag not in self._open:
+            self._malformed = True
+            return
+        while (top := self._open.pop()) != tag:
+            if top not in IMPLIED_END_TAGS:
+                self._malformed = True
+
+    def data(self, data: str) -> None:
+        if self._open and self._open[-1] in TABLE_SCOPE_TAGS and data.strip():
+            self._malformed = True
+        self._buf.append(data)
+
+    def comment(self, text: str) -> None:
+        self._flush()
+
+    def close(self) -> Optional[str]:
+        self._flush()
+        # Una etiqueta omitida sin cerrar indica HTML mal formado: mejor que decida html5lib
+        return None if self._skip or self._malformed else " ".join(self.parts)
+
+class _HTMLParserText(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.target = _TextTarget()
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.target.start(tag)
+        self.target.end(tag)
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+    def handle_comment(self, data):
+        self.target.comment(data)
+
+    def handle_decl(self, decl):
+        self.target.comment(decl)
+
+def _htmlparser_text(html: str) -> Optional[str]:
+    parser = _HTMLParserText()
+    parser.feed(html)
+    parser.close()
+    return parser.target.close()
+
+# Etiquetas de formato: html5lib reabre las mal anidadas (<b><i>x</b>y</i>) y libxml2 no, sin que
+# se note en los eventos del target
+_FORMATTING_TAG = re.compile(r"<(/?)(a|b|big|code|em|font|i|nobr|s|small|strike|strong|tt|u)[\s/>]", re.I)
+
+def _formatting_misnested(html: str) -> bool:
+    stack: List[str] = []
+    for closing, tag in _FORMATTING_TAG.findall(html):
+        tag = tag.lower()
+        if not closing:
+            stack.append(tag)
+        elif stack and stack[-1] == tag:
+            stack.pop()
+        elif tag in stack:
+            return True
+    return False
+
+def _lxml_text(html: str) -> Optional[str]:
+    if _formatting_misnested(html):
+        return None
+    parser = lxml_etree.HTMLParser(target=_TextTarget())
+    parser.feed(html)
+    return parser.close()
+
+# Extractores de texto: devuelven None si el HTML no es fiable y hay que recurrir a html5lib
+TEXT_EXTRACTORS = {
+    "html5lib": _html5lib_text,
+    "htmlparser": _htmlparser_text,
+    "lxml": _lxml_text,
+}
+# Fijo (no depende de que lxml esté instalado, que es opcional): solo biblioteca estándar
+DEFAULT_EXTRACTOR = os.environ.get("SOCIMI_BORME_EXTRACTOR", "htmlparser")
+_EXTRACTOR = TEXT_EXTRACTORS[DEFAULT_EXTRACTOR]
+
+def set_text_extractor(name: str) -> None:
+    global _EXTRACTOR
+    if name == "lxml" and lxml_etree is None:
+        raise SystemExit("El extractor 'lxml' requiere instalar lxml")
+    _EXTRACTOR = TEXT_EXTRACTORS[name]
+
+def text_from_borme_html(html: str) -> str:
+    try:
+        text = _EXTRACTOR(html)
+    except Exception:
+        text = None
+    if text is None:
+        count_stat("fallback_html5lib")
+        text = _html5lib_text(html)
+    return text
+
+# Equivalente sobre el HTML en bruto (bytes, UTF-8 o Latin-1): bytes.lower() solo pliega ASCII.
+# Si aparecen ſ/İ/ı en UTF-8 se deja pasar el acto para no perder el plegado de re.IGNORECASE.
+_FOLD_EXOTIC_BYTES = (b"\xc5\xbf", b"\xc4\xb0", b"\xc4\xb1")
+
+# Mismo criterio como regex de bytes (IGNORECASE solo pliega ASCII, igual que bytes.lower()) para
+# buffers sin .lower() ni "in", como las memoryview de un paquete mapeado: se busca sin copiar.
+_HTML_PREFILTER = re.compile(b"11/2009|(?i:socimi)|" + b"|".join(re.escape(seq) for seq in _FOLD_EXOTIC_BYTES))
+
+def html_candidate(raw: bytes) -> bool:
+    """
+    Prefiltro barato previo al parseo: False si el HTML no puede casar con ningún patrón.
+    Acepta bytes o cualquier buffer (memoryview, mmap).
+    """
+    if not isinstance(raw, bytes):
+        return _HTML_PREFILTER.search(raw) is not None
+    if b"11/2009" in raw or b"socimi" in raw.lower():
+        return True
+    return any(seq in raw for seq in _FOLD_EXOTIC_BYTES)
+
 def find_adoption(text: str) -> Optional[Tuple[str, str]]:
+    if not adoption_candidate(text):
+        return None
     for rx in ADOPTION_REGEXES:
         m = rx.search(text)
         if m:
@@ -133,55 +1349,365 @@ def find_adoption(text: str) -> Optional[Tuple[str, str]]:
             return rx.pattern, excerpt
     return None
 
-def process_date(fecha: dt.date, conn: sqlite3.Connection) -> int:
+def _item_url(item: Dict[str, Any], key: str) -> Optional[str]:
+    val = item.get(key)
+    return (val or {}).get("texto") if isinstance(val, dict) else val
+
+class TextStore:
+    """
+    Corpus de texto extraído por acto (solo se añade), en un SQLite aparte (CORPUS_FILE, no versionado)
+    con el texto comprimido con zlib. Acceso por identificador y recorrido secuencial por fechas.
+    """
+    def __init__(self, path: str = CORPUS_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS act_texts (
+                id TEXT PRIMARY KEY,
+                pub_date TEXT NOT NULL,
+                company TEXT,
+                apartado TEXT,
+                url_html TEXT,
+                url_pdf TEXT,
+                text_z BLOB NOT NULL
+            );
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_act_texts_date ON act_texts (pub_date, id)")
+        self.conn.commit()
+
+    def add_many(self, recs: Iterable[Dict[str, Any]]) -> int:
+        rows = [(r["id"], r["pub_date"], r.get("company"), r.get("apartado"), r.get("url_html"), r.get("url_pdf"),
+                 zlib.compress(r["text"].encode("utf-8"), 6)) for r in recs]
+        if rows:
+            with self.conn:
+                self.conn.executemany("INSERT OR IGNORE INTO act_texts VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def get(self, ident: str) -> Optional[str]:
+        row = self.conn.execute("SELECT text_z FROM act_texts WHERE id = ?", (ident,)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def iter_range(self, start: dt.date, end: dt.date) -> Iterable[Dict[str, Any]]:
+        """
+        Registros (metadatos del acto + "text") ordenados por fecha e identificador.
+        """
+        cur = self.conn.execute(
+            "SELECT id, pub_date, company, apartado, url_html, url_pdf, text_z FROM act_texts "
+            "WHERE pub_date BETWEEN ? AND ? ORDER BY pub_date, id",
+            (start.isoformat(), end.isoformat()),
+        )
+        for ident, pub_date, company, apartado, url_html, url_pdf, text_z in cur:
+            yield {"id": ident, "pub_date": pub_date, "company": company, "apartado": apartado,
+                   "url_html": url_html, "url_pdf": url_pdf, "text": zlib.decompress(text_z).decode("utf-8")}
+
+    def close(self) -> None:
+        self.conn.close()
+
+_TEXT_STORE: Optional[TextStore] = None
+# Con el corpus o el índice FTS activos se extrae el texto de todos los actos, no solo de los
+# que pasan el prefiltro
+_KEEP_TEXTS = False
+_INDEX_TEXTS = False
+
+def configure_text_store(path: Optional[str], writer: bool = True, index: bool = False) -> Optional[TextStore]:
+    """
+    Activa la extracción de texto de todos los actos; el corpus solo se abre en el proceso que escribe.
+    """
+    global _TEXT_STORE, _KEEP_TEXTS, _INDEX_TEXTS
+    _KEEP_TEXTS = bool(path) or index
+    _INDEX_TEXTS = index
+    _TEXT_STORE = TextStore(path) if path and writer else None
+    return _TEXT_STORE
+
+def classify_item(rec: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Descarga y clasifica un acto. Sin acceso a la DB: puede ejecutarse en cualquier hilo.
+    Devuelve (evento si casa, registro con el texto extraído si se guarda el corpus). Si la descarga
+    falla lanza la excepción: la fecha queda en 'error' con el checkpoint del último lote guardado.
+    """
+    raw = fetch_html_raw(rec["url_html"], rec["pub_date"])
+    if not raw:
+        count_stat("sin_html")
+        return None, None
+    if not _KEEP_TEXTS and not html_candidate(raw[0]):
+        count_stat("prefiltrados")
+        return None, None
+    count_stat("parseados")
+    with METRICS.timer("extraccion_texto"):
+        txt = text_from_borme_html(decode_html(*raw))
+    text_rec = dict(rec, text=txt) if _KEEP_TEXTS else None
+    with METRICS.timer("patrones"):
+        hit = find_adoption(txt)
+    if not hit:
+        return None, text_rec
+    matched_pattern, excerpt = hit
+    return dict(rec, matched_pattern=matched_pattern, excerpt=excerpt), text_rec
+
+def section_c_records(fecha: dt.date, sumario: Dict[str, Any]) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Devuelve (nº de items de la Sección C, registros base de los que tienen url_html).
+    """
+    n_items = 0
+    recs: List[Dict[str, Any]] = []
+    for item, apartado in iter_section_c_items(sumario):
+        n_items += 1
+        url_html = _item_url(item, "url_html")
+        if not url_html:
+            continue
+        recs.append({
+            "id": item.get("identificador"),
+            "pub_date": fecha.isoformat(),
+            "company": item.get("titulo"),
+            "apartado": apartado,
+            "url_html": url_html,
+            "url_pdf": _item_url(item, "url_pdf"),
+        })
+    return n_items, recs
+
+CHECKPOINT_EVERY = 100  # items entre checkpoints dentro de una fecha
+
+DateBatch = Tuple[int, str, List[Dict[str, Any]], Optional[str], bool, List[Dict[str, Any]]]
+
+def iter_date_batches(fecha: dt.date, workers: int = 1, resume_after: Optional[str] = None,
+                      every: int = CHECKPOINT_EVERY, known_hash: Optional[str] = None) -> Iterable[Optional[DateBatch]]:
+    """
+    Descarga y clasifica una fecha sin tocar la DB, en lotes de `every` items en orden del sumario.
+    Cada lote es (nº items, hash del sumario, eventos, último identificador procesado, final, textos);
+    produce un único None si no hay sumario (404). Con resume_after se salta hasta ese identificador.
+    Si el sumario coincide con known_hash (ya procesado) no se descarga ningún acto.
+    """
+    try:
+        yield from _date_batches(fecha, workers, resume_after, every, known_hash)
+    finally:
+        # El paquete de --record se cierra aunque la fecha termine con error (lo grabado se conserva)
+        if _RECORDER is not None:
+            _RECORDER.finish(fecha)
+
+def _date_batches(fecha: dt.date, workers: int, resume_after: Optional[str], every: int,
+                  known_hash: Optional[str]) -> Iterable[Optional[DateBatch]]:
     sumario = fetch_sumario(fecha)
     if not sumario:
+        yield None
+        return
+    n_items, pending = section_c_records(fecha, sumario)
+    s_hash = sumario_hash(sumario)
+    if known_hash == s_hash:
+        count_stat("sumarios_sin_cambios")
+        yield n_items, s_hash, [], None, True, []
+        return
+    ids = [rec["id"] for rec in pending]
+    if resume_after in ids:
+        pending = pending[ids.index(resume_after) + 1:]
+    last = resume_after
+    events: List[Dict[str, Any]] = []
+    texts: List[Dict[str, Any]] = []
+    # Descarga y clasificación en paralelo (resultados en orden); la escritura la hace quien consume
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        results = pool.map(classify_item, pending) if pool else map(classify_item, pending)
+        for i, (rec, (event, text_rec)) in enumerate(zip(pending, results), 1):
+            last = rec["id"]
+            if event:
+                events.append(event)
+            if text_rec:
+                texts.append(text_rec)
+            if i % every == 0 and i < len(pending):
+                yield n_items, s_hash, events, last, False, texts
+                events, texts = [], []
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    yield n_items, s_hash, events, last, True, texts
+
+def store_batch(conn: sqlite3.Connection, fecha: dt.date, batch: Optional[DateBatch]) -> int:
+    """
+    Escribe un lote y el checkpoint de la fecha en la misma transacción ('ok' en el lote final).
+    """
+    if batch is None:
         print(f"[{fecha}] No hay sumario BORME (404).")
+        ledger_mark(conn, fecha, "sin_sumario")
         return 0
+    t0 = time.perf_counter()
+    n_items, s_hash, events, last, final, texts = batch
+    # El corpus va primero: si se corta antes del commit de la fecha, al rehacerla se ignoran los ya guardados
+    if _TEXT_STORE is not None:
+        _TEXT_STORE.add_many(texts)
+    if _INDEX_TEXTS:
+        index_texts(conn, texts)
+    writer = EventWriter(conn)
+    for rec in events:
+        writer.add(rec)
+    ledger_mark(conn, fecha, "ok" if final else "en_curso", items=n_items, sumario_hash=s_hash,
+                commit=False, checkpoint=None if final else last)
+    writer.flush()
+    METRICS.observe("escritura_db", time.perf_counter() - t0)
+    return len(events)
+
+def process_date(fecha: dt.date, conn: sqlite3.Connection, workers: int = 1,
+                 resume_after: Optional[str] = None, known_hash: Optional[str] = None) -> int:
     count = 0
-    for item, apartado in iter_section_c_items(sumario):
-        url_html = (item.get("url_html") or {}).get("texto") if isinstance(item.get("url_html"), dict) else item.get("url_html")
-        url_pdf = (item.get("url_pdf") or {}).get("texto") if isinstance(item.get("url_pdf"), dict) else item.get("url_pdf")
-        ident = item.get("identificador")
-        company = item.get("titulo")
-        if not url_html:
-            continue
-        html = fetch_html(url_html)
-        if not html:
-            continue
-        txt = text_from_borme_html(html)
-        hit = find_adoption(txt)
-        if hit:
-            matched_pattern, excerpt = hit
-            rec = {
-                "id": ident,
-                "pub_date": fecha.isoformat(),
-                "company": company,
-                "apartado": apartado,
-                "url_html": url_html,
-                "url_pdf": url_pdf,
-                "matched_pattern": matched_pattern,
-                "excerpt": excerpt,
-            }
-            save_event(conn, rec)
-            count += 1
+    with METRICS.timer("fecha"):
+        for batch in iter_date_batches(fecha, workers, resume_after, known_hash=known_hash):
+            count += store_batch(conn, fecha, batch)
     return count
 
-def cmd_run(_):
+def _extract_worker(raw: bytes, meta: Dict[str, Any]) -> Tuple[str, int, float]:
+    """
+    Etapa de extracción en el pool de procesos: devuelve el texto, cuántas veces se recurrió a
+    html5lib y los segundos de extracción (las métricas del proceso hijo no llegan al padre).
+    """
+    before = RUN_STATS["fallback_html5lib"]
+    t0 = time.perf_counter()
+    text = text_from_borme_html(decode_html(raw, meta))
+    return text, RUN_STATS["fallback_html5lib"] - before, time.perf_counter() - t0
+
+async def collect_date_async(fecha: dt.date, workers: int, pool: ProcessPoolExecutor, n_extract: int,
+                             resume_after: Optional[str] = None, known_hash: Optional[str] = None) -> Optional[DateBatch]:
+    """
+    Versión asyncio de iter_date_batches: descarga → extracción → clasificación como etapas
+    unidas por colas acotadas, para solapar la latencia de red con el parseo (en procesos).
+    Las descargas siguen pasando por _CLIENT (caché, reintentos, límite de peticiones) en hilos.
+    Devuelve un único lote final, con los eventos en el mismo orden que el motor síncrono.
+    """
+    # Hilos propios: el ejecutor por defecto de asyncio (min(32, CPUs + 4)) limitaría --workers
+    io_pool = ThreadPoolExecutor(max_workers=max(workers, 1))
+    try:
+        return await _collect_date_async(fecha, workers, pool, io_pool, n_extract, resume_after, known_hash)
+    finally:
+        # Cancelar una tarea no detiene su hilo: se espera a las descargas en curso (las pendientes se
+        # cancelan) para que ninguna grabe en el paquete de --record después de cerrarse la fecha
+        await asyncio.to_thread(io_pool.shutdown, wait=True, cancel_futures=True)
+
+async def _collect_date_async(fecha: dt.date, workers: int, pool: ProcessPoolExecutor, io_pool: ThreadPoolExecutor,
+                              n_extract: int, resume_after: Optional[str], known_hash: Optional[str]) -> Optional[DateBatch]:
+    loop = asyncio.get_running_loop()
+    sumario = await loop.run_in_executor(io_pool, fetch_sumario, fecha)
+    if not sumario:
+        return None
+    n_items, pending = section_c_records(fecha, sumario)
+    if known_hash == sumario_hash(sumario):
+        count_stat("sumarios_sin_cambios")
+        return n_items, known_hash, [], None, True, []
+    ids = [rec["id"] for rec in pending]
+    if resume_after in ids:
+        pending = pending[ids.index(resume_after) + 1:]
+    fetched: asyncio.Queue = asyncio.Queue(maxsize=2 * n_extract)
+    extracted: asyncio.Queue = asyncio.Queue(maxsize=2 * n_extract)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(pending)
+    texts: List[Optional[Dict[str, Any]]] = [None] * len(pending)
+
+    todo = iter(enumerate(pending))
+
+    async def fetch_worker() -> None:
+        # Un worker no pide otro acto hasta dejar el anterior en la cola: si la extracción va lenta,
+        # las descargas esperan (como mucho `workers` cuerpos pendientes más los de la cola)
+        for i, rec in todo:
+            raw = await loop.run_in_executor(io_pool, fetch_html_raw, rec["url_html"], rec["pub_date"])
+            if not raw:
+                count_stat("sin_html")
+            elif not _KEEP_TEXTS and not html_candidate(raw[0]):
+                count_stat("prefiltrados")
+            else:
+                await fetched.put((i, raw))
+
+    async def fetch_stage() -> None:
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(max(workers, 1)):
+                tg.create_task(fetch_worker())
+        for _ in range(n_extract):
+            await fetched.put(None)
+
+    async def extract_stage() -> None:
+        while (job := await fetched.get()) is not None:
+            i, (raw, meta) = job
+            count_stat("parseados")
+            text, fallbacks, secs = await loop.run_in_executor(pool, _extract_worker, raw, meta)
+            count_stat("fallback_html5lib", fallbacks)
+            METRICS.observe("extraccion_texto", secs)
+            await extracted.put((i, text))
+
+    async def extract_all() -> None:
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(n_extract):
+                tg.create_task(extract_stage())
+        await extracted.put(None)
+
+    async def classify_stage() -> None:
+        while (job := await extracted.get()) is not None:
+            i, text = job
+            if _KEEP_TEXTS:
+                texts[i] = dict(pending[i], text=text)
+            with METRICS.timer("patrones"):
+                hit = find_adoption(text)
+            if hit:
+                results[i] = dict(pending[i], matched_pattern=hit[0], excerpt=hit[1])
+
+    # Con TaskGroup el fallo de una etapa cancela las demás; las descargas ya lanzadas en hilos
+    # terminan por su cuenta y collect_date_async las espera antes de devolver
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for stage in (fetch_stage(), extract_all(), classify_stage()):
+                tg.create_task(stage)
+    except BaseExceptionGroup as group:
+        # Se propaga el primer error real para que el mensaje "Error en <fecha>" siga siendo legible
+        err: BaseException = group
+        while isinstance(err, BaseExceptionGroup):
+            err = err.exceptions[0]
+        raise err from group
+    last = pending[-1]["id"] if pending else resume_after
+    return n_items, sumario_hash(sumario), [rec for rec in results if rec], last, True, [t for t in texts if t]
+
+async def _run_dates_async(conn: sqlite3.Connection, fechas: List[dt.date], workers: int,
+                           resume: Dict[dt.date, str], known: Dict[dt.date, str]) -> int:
+    total = 0
+    n_extract = os.cpu_count() or 1
+    with ProcessPoolExecutor(n_extract) as pool:
+        for d in fechas:
+            try:
+                with METRICS.timer("fecha"):
+                    batch = await collect_date_async(d, workers, pool, n_extract, resume.get(d), known.get(d))
+                    total += store_batch(conn, d, batch)
+            except Exception as e:
+                ledger_mark(conn, d, "error")
+                print(f"Error en {d}: {e}", file=sys.stderr)
+            finally:
+                if _RECORDER is not None:
+                    _RECORDER.finish(d)
+    return total
+
+def cmd_run(args):
     # Define ventana de 12 meses hasta hoy (zona Europe/Madrid)
-    tz_madrid = tz.gettz("Europe/Madrid")
-    today = dt.datetime.now(tz=tz_madrid).date()
+    today = madrid_today()
     start = today - relativedelta(months=12)
     total = 0
+    _configure_fetch(args)
     with sqlite3.connect(DB_FILE) as conn:
         ensure_db(conn)
-        for d in daterange(start, today):
-            try:
-                total += process_date(d, conn)
-                time.sleep(0.4)  # cortesía con el servidor
-            except Exception as e:
-                print(f"Error en {d}: {e}", file=sys.stderr)
+        # Solo fechas no completadas según borme_dates, salvo --full
+        fechas = dates_to_process(conn, start, today, args.full, args.all_days, _negative_ttl(args))
+        print(f"Fechas pendientes en la ventana: {len(fechas)}")
+        resume = {} if args.full else _recorded_only(ledger_checkpoints(conn, fechas))
+        # Hoy/ayer ya completados se vuelven a consultar (GET condicional): si el sumario no
+        # ha cambiado no se procesa nada más
+        known = _recorded_only(ledger_hashes(conn, [today - dt.timedelta(days=i) for i in range(REVALIDATE_DAYS + 1)
+                                                    if args.all_days or is_publication_day(today - dt.timedelta(days=i))]))
+        fechas = sorted(set(fechas) | set(known))
+        if args.engine == "async":
+            total = asyncio.run(_run_dates_async(conn, fechas, args.workers, resume, known))
+        else:
+            for d in fechas:
+                try:
+                    total += process_date(d, conn, workers=args.workers, resume_after=resume.get(d), known_hash=known.get(d))
+                except Exception as e:
+                    ledger_mark(conn, d, "error")
+                    print(f"Error en {d}: {e}", file=sys.stderr)
     print(f"Procesado ventana 12 meses: {start} → {today}. Nuevos eventos: {total}")
+    _print_fetch_summary()
+    _write_run_report(args, total)
 
 
 def daterange(d1: dt.date, d2: dt.date):
@@ -195,28 +1721,491 @@ def cmd_backfill(args):
     start = dt.date.fromisoformat(args.start)
     tz_madrid = tz.gettz("Europe/Madrid")
     end = dt.datetime.now(tz=tz_madrid).date()
+    if args.jobs > 1:
+        return _backfill_parallel(args, start, end)
     total = 0
+    _configure_fetch(args)
     with sqlite3.connect(DB_FILE) as conn:
         ensure_db(conn)
-        for d in daterange(start, end):
+        # Reanudable: salta fechas completadas y continúa las que quedaron a medias (salvo --full)
+        fechas = dates_to_process(conn, start, end, args.full, args.all_days, _negative_ttl(args))
+        resume = {} if args.full else _recorded_only(ledger_checkpoints(conn, fechas))
+        print(f"Backfill {start} → {end}: {len(fechas)} fechas pendientes ({len(resume)} a medias)")
+        for d in fechas:
             try:
-                total += process_date(d, conn)
-                time.sleep(0.5)
+                total += process_date(d, conn, workers=args.workers, resume_after=resume.get(d))
             except Exception as e:
+                ledger_mark(conn, d, "error")
                 print(f"Error en {d}: {e}", file=sys.stderr)
     print(f"Backfill terminado. Eventos nuevos: {total}")
+    _print_fetch_summary()
+    _write_run_report(args, total)
 
-def cmd_export(_):
-    import csv
+def _backfill_shard(shard: int, fechas: List[dt.date], resume: Dict[dt.date, str], args,
+                    limiter: TokenBucket, out) -> None:
+    """
+    Proceso hijo de backfill --jobs: descarga y clasifica sus fechas y envía cada lote al padre,
+    que es el único que escribe en la DB (y guarda los checkpoints).
+    """
+    # Con fork el hijo hereda los contadores y tiempos del padre: se envía solo lo de este shard
+    RUN_STATS.clear()
+    METRICS.reset()
+    _configure_fetch(args, writer=False)
+    _CLIENT.limiter = limiter
+    for d in fechas:
+        t0 = time.perf_counter()
+        try:
+            with METRICS.timer("fecha"):
+                for batch in iter_date_batches(d, args.workers, resume.get(d)):
+                    out.put(("lote", shard, d, batch, None, time.perf_counter() - t0))
+                    t0 = time.perf_counter()
+        except Exception as e:
+            out.put(("lote", shard, d, None, f"{type(e).__name__}: {e}", time.perf_counter() - t0))
+    cache = (_CACHE.hits, _CACHE.misses) if _CACHE is not None else (0, 0)
+    out.put(("fin", shard, dict(RUN_STATS), dict(_CLIENT.stats), cache, METRICS.snapshot()))
+
+def _merge_shard_stats(run_stats: Dict[str, int], client_stats: Dict[str, float], cache: Tuple[int, int],
+                       metrics: Dict[str, Dict[str, Any]]) -> None:
+    RUN_STATS.update(run_stats)
+    METRICS.merge(metrics)
+    for k, v in client_stats.items():
+        _CLIENT.stats[k] = max(_CLIENT.stats[k], v) if k == "max_seconds" else _CLIENT.stats[k] + v
+    if _CACHE is not None:
+        _CACHE.hits += cache[0]
+        _CACHE.misses += cache[1]
+
+def _backfill_parallel(args, start: dt.date, end: dt.date) -> None:
+    """
+    backfill --jobs N: reparte las fechas pendientes (sin 'ok' en borme_dates, así que se puede
+    reanudar tras una interrupción) en N tramos contiguos, uno por proceso, con un límite de
+    peticiones global. El proceso padre escribe cada lote y su checkpoint en una transacción.
+    """
+    _configure_fetch(args)
+    with sqlite3.connect(DB_FILE) as conn:
+        ensure_db(conn)
+        fechas = dates_to_process(conn, start, end, args.full, args.all_days, _negative_ttl(args))
+        resume = {} if args.full else _recorded_only(ledger_checkpoints(conn, fechas))
+        jobs = max(1, min(args.jobs, len(fechas)))
+        size = -(-len(fechas) // jobs) if fechas else 0
+        shards = [fechas[i * size:(i + 1) * size] for i in range(jobs)] if fechas else []
+        print(f"Backfill {start} → {end}: {len(fechas)} fechas pendientes en {len(shards)} procesos")
+        # Cubo de tokens global para todos los procesos; el del padre refleja el total en el resumen
+        limiter = TokenBucket(args.rps, args.burst, shared=True)
+        _CLIENT.limiter = limiter
+        out = multiprocessing.Queue(maxsize=4 * max(len(shards), 1))
+        procs = [multiprocessing.Process(target=_backfill_shard, args=(i, shard, resume, args, limiter, out), daemon=True)
+                 for i, shard in enumerate(shards)]
+        for pr in procs:
+            pr.start()
+        done = [0] * len(shards)
+        secs = [0.0] * len(shards)
+        acts = [0] * len(shards)
+        total = 0
+        running = len(procs)
+        t0 = time.perf_counter()
+        try:
+            while running:
+                try:
+                    msg = out.get(timeout=5)
+                except queue.Empty:
+                    if not any(pr.is_alive() for pr in procs):
+                        print("Los procesos de backfill terminaron sin avisar", file=sys.stderr)
+                        break
+                    continue
+                kind, shard = msg[0], msg[1]
+                if kind == "fin":
+                    _merge_shard_stats(*msg[2:6])
+                    running -= 1
+                    continue
+                _, _, d, batch, error, elapsed = msg
+                secs[shard] += elapsed
+                if error:
+                    ledger_mark(conn, d, "error")
+                    print(f"Error en {d}: {error}", file=sys.stderr)
+                else:
+                    total += store_batch(conn, d, batch)
+                    if batch is not None and not batch[4]:
+                        continue
+                    acts[shard] += batch[0] if batch else 0
+                done[shard] += 1
+                print(f"[tramo {shard}] {d} ({done[shard]}/{len(shards[shard])}) "
+                      f"{done[shard] / max(secs[shard], 1e-9) * 60:.1f} fechas/min, "
+                      f"{acts[shard] / max(secs[shard], 1e-9):.1f} actos/s")
+        finally:
+            for pr in procs:
+                if pr.is_alive() and running:
+                    pr.terminate()
+                pr.join()
+    wall = time.perf_counter() - t0
+    print(f"Backfill terminado. Eventos nuevos: {total} ({sum(done)} fechas en {wall:.0f}s)")
+    _print_fetch_summary()
+    _write_run_report(args, total)
+
+def _date_spans(fechas: List[dt.date]) -> str:
+    """
+    Compacta fechas en tramos consecutivos: "2024-01-01..2024-01-05, 2024-01-09".
+    """
+    spans: List[List[dt.date]] = []
+    for d in sorted(fechas):
+        if spans and d - spans[-1][1] == dt.timedelta(days=1):
+            spans[-1][1] = d
+        else:
+            spans.append([d, d])
+    return ", ".join(str(a) if a == b else f"{a}..{b}" for a, b in spans)
+
+def cmd_status(args):
     with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.execute("SELECT id, pub_date, company, apartado, url_html, url_pdf, matched_pattern, excerpt FROM socimi_events ORDER BY pub_date DESC, id DESC")
-        rows = cur.fetchall()
-    with open(CSV_FILE, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["id","pub_date","company","apartado","url_html","url_pdf","matched_pattern","excerpt"])
-        for r in rows:
-            w.writerow(r)
-    print(f"Exportado {len(rows)} filas a {CSV_FILE}")
+        ensure_db(conn)
+        rows = conn.execute("SELECT fecha, status, items, checkpoint FROM borme_dates ORDER BY fecha").fetchall()
+    ledger = {dt.date.fromisoformat(r[0]): r[1:] for r in rows}
+    if args.start:
+        start = dt.date.fromisoformat(args.start)
+    else:
+        start = min(ledger, default=madrid_today())
+    end = dt.date.fromisoformat(args.end) if args.end else madrid_today()
+    groups: Dict[str, List[dt.date]] = {"ok": [], "sin_sumario": [], "en_curso": [], "error": [], "pendiente": [],
+                                        "sin_publicacion": []}
+    for d in daterange(start, end):
+        if d in ledger:
+            status = ledger[d][0]
+        else:
+            status = "pendiente" if is_publication_day(d) else "sin_publicacion"
+        groups.setdefault(status, []).append(d)
+    items = sum(ledger[d][1] or 0 for d in groups["ok"])
+    print(f"Estado {start} → {end} (esquema v{SCHEMA_VERSION})")
+    print(f"  completadas: {len(groups['ok'])} ({items} items), sin sumario: {len(groups['sin_sumario'])}, "
+          f"sin BORME según calendario: {len(groups['sin_publicacion'])}")
+    for status, label in (("en_curso", "a medias"), ("error", "fallidas"), ("pendiente", "pendientes")):
+        print(f"  {label}: {len(groups[status])}")
+        if groups[status]:
+            print(f"    {_date_spans(groups[status])}")
+    for d in groups["en_curso"] + groups["error"]:
+        if ledger[d][2]:
+            print(f"    {d}: reanuda tras {ledger[d][2]}")
+
+def classify_html(html: str) -> Optional[Tuple[str, str]]:
+    return find_adoption(text_from_borme_html(html))
+
+def _reclassify_date(conn: sqlite3.Connection, d: dt.date, checked: Iterable[str],
+                     new: Dict[str, Dict[str, Any]], args, totals: Dict[str, int]) -> None:
+    """
+    Compara los eventos recalculados de una fecha con socimi_events, imprime el diff y lo aplica.
+    """
+    old = {row[0]: row[1:] for row in conn.execute(
+        "SELECT id, matched_pattern, company FROM socimi_events_v WHERE pub_date = ?", (d.isoformat(),))}
+    checked = set(checked)
+    diff = [("+", i) for i in sorted(new.keys() - old.keys())]
+    diff += [("-", i) for i in sorted((old.keys() & checked) - new.keys())]
+    diff += [("~", i) for i in sorted(new.keys() & old.keys()) if new[i]["matched_pattern"] != old[i][0]]
+    for sign, ident in diff:
+        totals[sign] += 1
+        company = new[ident]["company"] if ident in new else old[ident][1]
+        print(f"{sign} {d} {ident} {company}")
+    if diff and not args.dry_run:
+        with conn:
+            upsert_events(conn, [new[i] for s_, i in diff if s_ != "-"])
+            conn.executemany("DELETE FROM socimi_events WHERE id = ?", [(i,) for s_, i in diff if s_ == "-"])
+
+def _reclassify_corpus(conn: sqlite3.Connection, start: dt.date, end: dt.date, args, totals: Dict[str, int]) -> None:
+    """
+    reclassify --corpus: aplica find_adoption sobre el texto ya extraído, sin parsear HTML.
+    """
+    store = TextStore(args.corpus)
+    try:
+        day: Optional[str] = None
+        checked: List[str] = []
+        new: Dict[str, Dict[str, Any]] = {}
+        for rec in store.iter_range(start, end):
+            if rec["pub_date"] != day:
+                if day is not None:
+                    _reclassify_date(conn, dt.date.fromisoformat(day), checked, new, args, totals)
+                day, checked, new = rec["pub_date"], [], {}
+            totals["actos"] += 1
+            checked.append(rec["id"])
+            hit = find_adoption(rec.pop("text"))
+            if hit:
+                new[rec["id"]] = dict(rec, matched_pattern=hit[0], excerpt=hit[1])
+        if day is not None:
+            _reclassify_date(conn, dt.date.fromisoformat(day), checked, new, args, totals)
+    finally:
+        store.close()
+
+def cmd_reclassify(args):
+    """
+    Reaplica ADOPTION_PATTERNS sobre el HTML en caché (o grabado, con --source, o el corpus de textos
+    con --corpus), sin red, y sincroniza socimi_events.
+    """
+    start = dt.date.fromisoformat(args.start)
+    end = dt.date.fromisoformat(args.end) if args.end else madrid_today()
+    set_text_extractor(args.extractor)
+    totals = {"actos": 0, "sin_cache": 0, "+": 0, "-": 0, "~": 0}
+    t0 = time.perf_counter()
+    pool = ProcessPoolExecutor(args.jobs) if args.jobs > 1 and not args.corpus else None
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            ensure_db(conn)
+            if args.corpus:
+                _reclassify_corpus(conn, start, end, args, totals)
+            else:
+                # Respuestas grabadas (--source: paquetes de --record, caché o espejo) o la caché local
+                cache = ReplaySource(args.source) if args.source else DiskCache(args.cache_dir)
+                for d in daterange(start, end):
+                    hit = cache.get(SUMARIO_URL.format(date=yyyymmdd(d)))
+                    if hit is None:
+                        continue
+                    _, recs = section_c_records(d, json.loads(hit[0]))
+                    available, candidates, htmls = [], [], []
+                    for rec in recs:
+                        # Con paquetes raw el prefiltro lee el fichero mapeado; solo se decodifican candidatos
+                        h = cache.view(rec["url_html"]) if args.source else cache.get(rec["url_html"])
+                        if h is None:
+                            totals["sin_cache"] += 1
+                            continue
+                        available.append(rec)
+                        if html_candidate(h[0]):
+                            candidates.append(rec)
+                            htmls.append(decode_html(*h))
+                        if isinstance(h[0], memoryview):
+                            h[0].release()
+                    totals["actos"] += len(available)
+                    hits = pool.map(classify_html, htmls, chunksize=32) if pool else map(classify_html, htmls)
+                    new = {rec["id"]: dict(rec, matched_pattern=h[0], excerpt=h[1]) for rec, h in zip(candidates, hits) if h}
+                    _reclassify_date(conn, d, (rec["id"] for rec in available), new, args, totals)
+    finally:
+        if pool:
+            pool.shutdown()
+    secs = time.perf_counter() - t0
+    print(f"Reclasificados {totals['actos']} actos en {secs:.1f}s ({totals['actos'] / max(secs, 1e-9) * 60:.0f} actos/min); "
+          f"sin caché: {totals['sin_cache']}. Altas: {totals['+']}, bajas: {totals['-']}, cambios de patrón: {totals['~']}"
+          + (" (dry-run)" if args.dry_run else ""))
+
+def cmd_index(args):
+    """
+    Carga en act_fts los textos del corpus (run/backfill --store-text) sin volver a descargar.
+    """
+    start = dt.date.fromisoformat(args.start) if args.start else dt.date.min
+    end = dt.date.fromisoformat(args.end) if args.end else madrid_today()
+    store = TextStore(args.corpus)
+    added = 0
+    t0 = time.perf_counter()
+    try:
+        with sqlite3.connect(DB_FILE) as conn:
+            ensure_db(conn)
+            ensure_fts(conn)
+            batch: List[Dict[str, Any]] = []
+            for rec in store.iter_range(start, end):
+                batch.append(rec)
+                if len(batch) >= 1000:
+                    added += index_texts(conn, batch)
+                    conn.commit()
+                    batch = []
+            added += index_texts(conn, batch)
+            conn.commit()
+            if args.optimize:
+                conn.execute("INSERT INTO act_fts (act_fts) VALUES ('optimize')")
+                conn.commit()
+    finally:
+        store.close()
+    print(f"Indexados {added} actos nuevos en {time.perf_counter() - t0:.1f}s")
+
+def cmd_search(args):
+    """
+    Búsqueda en act_fts con la sintaxis de FTS5: "frase exacta", prefijo*, NEAR(a b, 10), AND/OR/NOT
+    y columna (company: ...).
+    """
+    start = args.start or "0000-01-01"
+    end = args.end or madrid_today().isoformat()
+    with sqlite3.connect(DB_FILE) as conn:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'act_fts'").fetchone() is None:
+            print("No hay índice de texto: usa run/backfill --index-text o el comando index", file=sys.stderr)
+            sys.exit(1)
+        t0 = time.perf_counter()
+        try:
+            rows = conn.execute(
+                """
+                SELECT d.pub_date, d.id, d.company, snippet(act_fts, 1, '[', ']', '…', ?)
+                FROM act_fts JOIN act_docs d ON d.docid = act_fts.rowid
+                WHERE act_fts MATCH ? AND d.pub_date BETWEEN ? AND ?
+                ORDER BY rank LIMIT ?
+                """,
+                (args.tokens, args.query, start, end, args.limit),
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            print(f"Consulta FTS5 no válida: {e}", file=sys.stderr)
+            sys.exit(2)
+        ms = (time.perf_counter() - t0) * 1000
+    for pub_date, ident, company, snip in rows:
+        print(f"{pub_date} {ident} {company}\n    {' '.join(snip.split())}")
+    print(f"{len(rows)} resultados en {ms:.1f} ms" + (f" (límite {args.limit})" if len(rows) == args.limit else ""))
+
+EXPORT_COLUMNS = ["id", "pub_date", "company", "apartado", "url_html", "url_pdf", "matched_pattern", "excerpt"]
+EXPORT_CHUNK = 5000
+
+def cmd_export(args):
+    """
+    Exporta socimi_events_v a CSV (más reciente primero) leyendo el cursor por bloques, en un fichero
+    temporal que sustituye al CSV al terminar. Con --since solo se consultan las fechas >= since: esas
+    filas encabezan el fichero y el resto se copia tal cual del CSV anterior.
+    """
+    import csv
+    out = args.output
+    # Fecha ya validada por argparse; en ISO se compara bien como texto con pub_date
+    since = args.since.isoformat() if args.since and os.path.exists(out) else None
+    tmp = out + ".tmp"
+    rows = kept = 0
+    try:
+        with sqlite3.connect(DB_FILE) as conn, open(tmp, "w", newline="", encoding="utf-8") as f:
+            ensure_db(conn)
+            w = csv.writer(f)
+            w.writerow(EXPORT_COLUMNS)
+            cur = conn.execute(
+                f"SELECT {', '.join(EXPORT_COLUMNS)} FROM socimi_events_v WHERE pub_date >= ? ORDER BY pub_date DESC, id DESC",
+                (since or "",),
+            )
+            while True:
+                chunk = cur.fetchmany(EXPORT_CHUNK)
+                if not chunk:
+                    break
+                w.writerows(chunk)
+                rows += len(chunk)
+            if since:
+                with open(out, newline="", encoding="utf-8") as old:
+                    r = csv.reader(old)
+                    if next(r, None) != EXPORT_COLUMNS:
+                        raise SystemExit(f"{out} no tiene las columnas esperadas: exporta sin --since")
+                    i_date = EXPORT_COLUMNS.index("pub_date")
+                    for row in r:
+                        if row[i_date] < since:
+                            w.writerow(row)
+                            kept += 1
+    except BaseException:
+        # El CSV anterior queda intacto (el temporal puede no existir si falló al abrirlo)
+        with suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, out)
+    print(f"Exportado {rows + kept} filas a {out}" + (f" ({rows} desde {since}, {kept} del CSV anterior)" if since else ""))
+
+def cmd_cache(args):
+    cache = DiskCache(args.cache_dir, args.max_mb)
+    if args.cache_cmd == "prune":
+        removed, freed = cache.prune()
+        print(f"Caché {args.cache_dir}: eliminadas {removed} entradas ({freed / 1048576:.1f} MB)")
+    st = cache.stats()
+    fmt = lambda ts: dt.datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else "-"
+    print(f"Caché {args.cache_dir}: {st['entries']} entradas, {st['bytes'] / 1048576:.1f} MB "
+          f"(límite {args.max_mb:g} MB), uso más antiguo {fmt(st['oldest'])}, más reciente {fmt(st['newest'])}")
+
+_RUN_STARTED: Tuple[float, str] = (time.perf_counter(), "")
+
+def _configure_fetch(args, writer: bool = True) -> None:
+    global _RUN_STARTED
+    _RUN_STARTED = (time.perf_counter(), dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"))
+    set_text_extractor(args.extractor)
+    configure_source(args.source)
+    configure_recorder(args.record, args.record_codec)
+    configure_text_store(args.corpus if args.store_text else None, writer, args.index_text)
+    set_revalidate_all(args.revalidate)
+    configure_client(args.workers, args.rps, args.burst)
+    configure_cache(None if args.no_cache else args.cache_dir, args.cache_mb)
+
+def _negative_ttl(args) -> dt.timedelta:
+    return dt.timedelta(minutes=args.negative_ttl)
+
+def _print_fetch_summary() -> None:
+    print(_CLIENT.summary())
+    print(_CLIENT.limiter.summary())
+    if _CACHE is not None:
+        print(f"Caché: {_CACHE.hits} aciertos, {_CACHE.misses} fallos")
+    print(f"Actos: {RUN_STATS['prefiltrados']} descartados por prefiltro, {RUN_STATS['parseados']} parseados, "
+          f"{RUN_STATS['sin_html']} sin HTML, {RUN_STATS['actos_fallidos']} con error de descarga, "
+          f"{RUN_STATS['fallback_html5lib']} con respaldo html5lib")
+    print(f"Fechas omitidas sin petición: {RUN_STATS['fechas_fuera_calendario']} por calendario, "
+          f"{RUN_STATS['cache_negativa']} por caché negativa (404 vigente)")
+    print(f"Transferencia: {RUN_STATS['bytes_descargados'] / 1048576:.1f} MB descargados, "
+          f"{RUN_STATS['bytes_ahorrados_cache'] / 1048576:.1f} MB servidos desde caché, "
+          f"{RUN_STATS['bytes_ahorrados_304'] / 1048576:.1f} MB ahorrados por {RUN_STATS['respuestas_304']} respuestas 304; "
+          f"{RUN_STATS['sumarios_sin_cambios']} sumarios sin cambios")
+    if _RECORDER is not None:
+        print(f"Grabación en {_RECORDER.root}: {RUN_STATS['paquetes_grabados']} paquetes, "
+              f"{RUN_STATS['respuestas_grabadas']} respuestas")
+    if _REPLAY is not None:
+        print(f"Origen {_REPLAY.path}: {RUN_STATS['bytes_leidos_local'] / 1048576:.1f} MB leídos, "
+              f"{RUN_STATS['no_grabadas']} URLs sin respuesta grabada")
+    stages = METRICS.report()
+    if stages:
+        print("Etapas (n, p50/p95 ms): " + ", ".join(
+            f"{name} {st['n']} {st['p50_ms']:.1f}/{st['p95_ms']:.1f}" for name, st in stages.items()))
+
+def _write_run_report(args, new_events: int) -> None:
+    """
+    Informe JSON de la ejecución (--report): latencias por etapa, bytes, actos/s y errores.
+    El workflow lo versiona junto a la DB para seguir la evolución entre ejecuciones.
+    """
+    if not args.report:
+        return
+    wall = time.perf_counter() - _RUN_STARTED[0]
+    acts = RUN_STATS["parseados"] + RUN_STATS["prefiltrados"] + RUN_STATS["sin_html"]
+    report = {
+        "command": args.cmd,
+        "engine": getattr(args, "engine", "sync"),
+        "jobs": getattr(args, "jobs", 1),
+        "workers": args.workers,
+        "source": args.source or "https://www.boe.es",
+        "started_at": _RUN_STARTED[1],
+        "finished_at": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "wall_seconds": round(wall, 3),
+        "dates": {k: RUN_STATS[f"fechas_{k}"] for k in ("ok", "sin_sumario", "error")},
+        "acts": acts,
+        "acts_per_second": round(acts / max(wall, 1e-9), 2),
+        "new_events": new_events,
+        "bytes": {"downloaded": RUN_STATS["bytes_descargados"], "from_cache": RUN_STATS["bytes_ahorrados_cache"],
+                  "saved_304": RUN_STATS["bytes_ahorrados_304"], "from_source": RUN_STATS["bytes_leidos_local"]},
+        "errors": {"http": int(_CLIENT.stats["errors"]), "http_retries": int(_CLIENT.stats["retries"]),
+                   "dates": RUN_STATS["fechas_error"], "acts_without_html": RUN_STATS["sin_html"],
+                   "acts_failed": RUN_STATS["actos_fallidos"]},
+        "http_requests": int(_CLIENT.stats["requests"]),
+        "counters": dict(sorted(RUN_STATS.items())),
+        "stages": METRICS.report(),
+    }
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"Informe de la ejecución en {args.report}")
+
+def _add_fetch_args(sp: argparse.ArgumentParser) -> None:
+    sp.add_argument("--source", default=DEFAULT_SOURCE,
+                    help="URL base alternativa a https://www.boe.es, o directorio/.tar/.zip de respuestas grabadas "
+                         "(estructura de la caché o espejo www.boe.es/...); env SOCIMI_BORME_SOURCE")
+    sp.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Descargas de actos en paralelo (máx. en vuelo)")
+    sp.add_argument("--rps", type=float, default=DEFAULT_RPS,
+                    help="Peticiones por segundo a boe.es, máximo de la tasa adaptativa (0 = sin límite; env SOCIMI_BORME_RPS)")
+    sp.add_argument("--burst", type=float, default=DEFAULT_BURST,
+                    help="Ráfaga máxima de peticiones seguidas (por defecto = rps; env SOCIMI_BORME_BURST)")
+    sp.add_argument("--cache-dir", default=CACHE_DIR, help="Directorio de la caché de respuestas BOE")
+    sp.add_argument("--cache-mb", type=float, default=CACHE_MAX_MB, help="Tamaño máximo de la caché (MB)")
+    sp.add_argument("--no-cache", action="store_true", help="Descarga siempre de boe.es sin usar la caché")
+    sp.add_argument("--revalidate", action="store_true",
+                    help="Confirma cada entrada de la caché con GET condicional (ETag/Last-Modified)")
+    sp.add_argument("--all-days", action="store_true",
+                    help="Consulta también fines de semana y festivos nacionales")
+    sp.add_argument("--negative-ttl", type=float, default=NEGATIVE_TTL_RECENT.total_seconds() / 60,
+                    help="Minutos que se recuerda un 404 del sumario de hoy/ayer (env SOCIMI_BORME_NEGATIVE_TTL_MIN)")
+    sp.add_argument("--store-text", action="store_true",
+                    help="Guarda el texto extraído de todos los actos en el corpus comprimido (desactiva el prefiltro)")
+    sp.add_argument("--corpus", default=CORPUS_FILE, help="Fichero SQLite del corpus de textos")
+    sp.add_argument("--record", metavar="DIR",
+                    help="Graba sumarios y HTML de actos en un paquete por fecha (DIR/AAAA/AAAAMMDD.borme), reproducible con --source DIR")
+    sp.add_argument("--record-codec", choices=BUNDLE_CODECS, default="zlib",
+                    help="zlib: paquetes pequeños para compartir; raw: sin comprimir, el prefiltro de reclassify --source lee el mapa sin copiar")
+    sp.add_argument("--report", default=REPORT_FILE, help="Informe JSON de la ejecución ('' para no escribirlo)")
+    sp.add_argument("--index-text", action="store_true",
+                    help="Indexa el texto de todos los actos en act_fts (FTS5) para el comando search")
+    _add_extractor_arg(sp)
+
+def _add_extractor_arg(sp: argparse.ArgumentParser) -> None:
+    sp.add_argument("--extractor", choices=sorted(TEXT_EXTRACTORS), default=DEFAULT_EXTRACTOR,
+                    help="Extractor de texto HTML (html5lib es el más lento; se usa de respaldo)")
 
 def build_cli():
     import argparse
@@ -224,15 +2213,61 @@ def build_cli():
     sub = p.add_subparsers(dest="cmd", required=True)
 
     p_run = sub.add_parser("run", help="Procesa el BORME del día (o viernes si es fin de semana)")
+    p_run.add_argument("--full", action="store_true", help="Reprocesa toda la ventana ignorando borme_dates")
+    p_run.add_argument("--engine", choices=["sync", "async"], default="sync",
+                       help="sync: hilos por fecha; async: etapas asyncio con extracción en procesos")
+    _add_fetch_args(p_run)
     p_run.set_defaults(func=cmd_run)
 
     p_bf = sub.add_parser("backfill", help="Procesa un rango desde --from hasta hoy (incl.)")
     p_bf.add_argument("--from", dest="start", required=True, help="AAAA-MM-DD")
+    p_bf.add_argument("--jobs", type=int, default=1, help="Procesos en paralelo")
+    p_bf.add_argument("--full", action="store_true", help="Reprocesa todo el rango ignorando borme_dates")
+    _add_fetch_args(p_bf)
     p_bf.set_defaults(func=cmd_backfill)
 
+    p_st = sub.add_parser("status", help="Fechas completadas, a medias, fallidas y pendientes según borme_dates")
+    p_st.add_argument("--from", dest="start", help="AAAA-MM-DD (por defecto la primera fecha registrada)")
+    p_st.add_argument("--to", dest="end", help="AAAA-MM-DD (por defecto hoy)")
+    p_st.set_defaults(func=cmd_status)
+
+    p_ix = sub.add_parser("index", help="Indexa en FTS5 los textos del corpus (para search)")
+    p_ix.add_argument("--from", dest="start", help="AAAA-MM-DD (por defecto todo el corpus)")
+    p_ix.add_argument("--to", dest="end", help="AAAA-MM-DD (por defecto hoy)")
+    p_ix.add_argument("--corpus", default=CORPUS_FILE)
+    p_ix.add_argument("--optimize", action="store_true", help="Compacta el índice al terminar")
+    p_ix.set_defaults(func=cmd_index)
+
+    p_se = sub.add_parser("search", help="Busca en el texto de los actos indexados (sintaxis FTS5)")
+    p_se.add_argument("query", help='Ej.: \'"Ley 11/2009"\', \'socimi*\', \'NEAR(régimen socimi, 5)\'')
+    p_se.add_argument("--from", dest="start", help="AAAA-MM-DD")
+    p_se.add_argument("--to", dest="end", help="AAAA-MM-DD (por defecto hoy)")
+    p_se.add_argument("--limit", type=int, default=50)
+    p_se.add_argument("--tokens", type=int, default=16, help="Palabras del fragmento mostrado")
+    p_se.set_defaults(func=cmd_search)
+
     p_exp = sub.add_parser("export", help="Exporta CSV desde la base de datos")
+    p_exp.add_argument("--since", type=dt.date.fromisoformat, help="AAAA-MM-DD: solo rehace las filas desde esa fecha y conserva el resto del CSV")
+    p_exp.add_argument("--output", default=CSV_FILE)
     p_exp.set_defaults(func=cmd_export)
 
+    p_rc = sub.add_parser("reclassify", help="Reaplica los patrones sobre el HTML en caché o el corpus de textos (sin red)")
+    p_rc.add_argument("--from", dest="start", required=True, help="AAAA-MM-DD")
+    p_rc.add_argument("--to", dest="end", help="AAAA-MM-DD (por defecto hoy)")
+    p_rc.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Procesos de clasificación")
+    p_rc.add_argument("--cache-dir", default=CACHE_DIR)
+    p_rc.add_argument("--source", help="Directorio o .tar/.zip de respuestas grabadas (p. ej. run --record DIR) en vez de la caché")
+    p_rc.add_argument("--dry-run", action="store_true", help="Solo muestra el diff, sin tocar la DB")
+    p_rc.add_argument("--corpus", help="Reclasifica desde el corpus de textos (run/backfill --store-text) en vez de la caché HTML")
+    _add_extractor_arg(p_rc)
+    p_rc.set_defaults(func=cmd_reclassify)
+
+    p_cache = sub.add_parser("cache", help="Gestiona la caché en disco de respuestas BOE")
+    p_cache.add_argument("cache_cmd", choices=["stats", "prune"])
+    p_cache.add_argument("--cache-dir", default=CACHE_DIR)
+    p_cache.add_argument("--max-mb", type=float, default=CACHE_MAX_MB, help="Límite para prune (MB)")
+    p_cache.set_defaults(func=cmd_cache)
+
     return p
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+"""
+Paridad de los extractores de texto rápidos (htmlparser, lxml) con html5lib, que es la referencia:
+en HTML bien formado deben dar el mismo texto sin recurrir a html5lib, y en HTML mal formado o dar
+el mismo texto o devolver None (respaldo html5lib), nunca un texto distinto.
+
+Uso: python -m unittest (o python -m pytest)
+"""
+import unittest
+
+import socimi_borme_pipeline as pipeline
+
+ACTO_BORME = """<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8"><title>BORME-C-2024-1234</title>
+<style>p { margin: 0 }</style><script>var x = "<p>no</p>";</script></head>
+<body><header><a href="/">BOE</a></header><nav><ul><li>Inicio<li>BORME</ul></nav>
+<div id="textoxslt"><h4 class="documento-tit">INMOBILIARIA EJEMPLO SOCIMI, S.A.</h4>
+<p class="parrafo">La Junta General acordó el 12/03/2024 optar por la aplicaci&oacute;n del
+<b>régimen fiscal especial</b> de las SOCIMI<br>regulado en la Ley 11/2009, de 26 de octubre.</p>
+<!-- fin del acto --><table class="datos"><caption>Datos</caption><thead><tr><th>Capital</th></tr></thead>
+<tbody><tr><td>5.000.000&nbsp;euros</td></tr></tbody></table>
+<p>Madrid, 14 de marzo de 2024.- El Secretario del Consejo.</p></div>
+<footer>Agencia Estatal Boletín Oficial del Estado</footer></body></html>"""
+
+# HTML mal formado que html5lib repara moviendo o separando texto
+MAL_FORMADOS = {
+    "texto_suelto_en_tabla": "<table><tr><td>A</td></tr>texto suelto<tr><td>B</td></tr></table>",
+    "elemento_suelto_en_tabla": "<table><tr><td>A</td></tr><p>suelto</p><tr><td>B</td></tr></table>",
+    "tabla_sin_tbody_ni_cierres": "<table><tr><td>A<td>B<tr><td>C</table>D",
+    "tabla_anidada": "<table><tr><td><table><tr><td>x</td></tr></table>y</td></tr></table>",
+    "formulario_en_tabla": "<table><form><tr><td>x</td></tr></form></table>",
+    "cierre_huerfano": "<p>SOCIEDAD</span>ANONIMA</p>",
+    "formato_mal_anidado": "<p><b>uno<i>dos</b>tres</i>cuatro</p>",
+    "p_sin_cerrar": "<div><p>uno<p>dos<div>tres</div>cuatro",
+    "li_sin_cerrar": "<ul><li>uno<li>dos</ul>fin",
+    "dl_sin_cerrar": "<dl><dt>t<dd>d<dt>t2</dl>",
+    "select_sin_cerrar": "<select><option>a<option>b</select>c",
+    "body_repetido": "<html><body>uno<body>dos</body></html>",
+    "script_sin_cerrar": "<p>uno</p><script>var x = 1;",
+    "nav_sin_cerrar": "<p>SOCIMI</p><nav>menú",
+}
+
+FAST_EXTRACTORS = ["htmlparser"] + (["lxml"] if pipeline.lxml_etree is not None else [])
+
+
+class TextExtractionParityTest(unittest.TestCase):
+    def tearDown(self):
+        pipeline.set_text_extractor(pipeline.DEFAULT_EXTRACTOR)
+
+    def test_default_extractor_does_not_depend_on_lxml(self):
+        self.assertEqual(pipeline.DEFAULT_EXTRACTOR, "htmlparser")
+
+    def test_well_formed_act_matches_without_fallback(self):
+        ref = pipeline._html5lib_text(ACTO_BORME)
+        self.assertIsNotNone(pipeline.find_adoption(ref))
+        for name in FAST_EXTRACTORS:
+            with self.subTest(extractor=name):
+                text = pipeline.TEXT_EXTRACTORS[name](ACTO_BORME)
+                self.assertEqual(text, ref)
+                self.assertEqual(pipeline.find_adoption(text), pipeline.find_adoption(ref))
+
+    def test_malformed_html_matches_or_falls_back(self):
+        for name in FAST_EXTRACTORS:
+            for case, html in MAL_FORMADOS.items():
+                with self.subTest(extractor=name, case=case):
+                    ref = pipeline._html5lib_text(html)
+                    text = pipeline.TEXT_EXTRACTORS[name](html)
+                    if text is not None:
+                        self.assertEqual(text, ref)
+                    pipeline.set_text_extractor(name)
+                    self.assertEqual(pipeline.text_from_borme_html(html), ref)
+
+    def test_foster_parented_text_falls_back_to_html5lib(self):
+        html = MAL_FORMADOS["texto_suelto_en_tabla"]
+        self.assertEqual(pipeline._html5lib_text(html), "texto suelto A B")
+        for name in FAST_EXTRACTORS:
+            with self.subTest(extractor=name):
+                self.assertIsNone(pipeline.TEXT_EXTRACTORS[name](html))
+
+
+if __name__ == "__main__":
+    unittest.main()